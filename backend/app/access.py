@@ -0,0 +1,81 @@
+"""
+Who can read which note.
+
+A user can read the notes they own, the public notes and the notes shared
+with them. Every endpoint resolves access through this module:
+
+* `readable_note_ids(user_id)` selects the ids of all those notes as a
+  UNION of three index lookups (`idx_notes_user_updated_id`,
+  `idx_shared_with_note`, `idx_notes_public`), so searches filter on
+  `Note.id IN (...)` instead of OR-ing the three conditions on every row.
+* `get_note` loads one note together with whether the user may read it,
+  in one query.
+"""
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import exists, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.note import Note, SharedNote
+
+NOT_FOUND = "not_found"
+FORBIDDEN = "forbidden"
+
+
+def _shared_with(user_id: int):
+    return select(SharedNote.note_id).where(
+        SharedNote.shared_with_user_id == user_id)
+
+
+def readable_note_ids(user_id: int):
+    """Ids of the notes `user_id` can read, for `Note.id.in_(...)`."""
+    # UNION ALL: IN ignores duplicates, no need to sort them away
+    return union_all(
+        select(Note.id).where(Note.user_id == user_id),
+        _shared_with(user_id),
+        # `= 1` rather than `IS 1`: SQLite only matches the partial index
+        # on the former
+        select(Note.id).where(Note.is_public == True),
+    )
+
+
+def _is_shared(user_id: int):
+    return exists().where(
+        SharedNote.shared_with_user_id == user_id,
+        SharedNote.note_id == Note.id,
+    )
+
+
+def get_note(
+    db: Session,
+    user_id: int,
+    note_id: int,
+    *,
+    must_be_owner: bool = False,
+    options: Iterable = (),
+    for_update: bool = False,
+) -> Tuple[Optional[Note], Optional[str]]:
+    """
+    The note and None when the user may read it (own it, if
+    `must_be_owner`), otherwise the note or None and NOT_FOUND / FORBIDDEN.
+    `for_update` locks the note row until the end of the transaction.
+    """
+    stmt = select(Note).options(*options).where(Note.id == note_id)
+    if for_update:
+        stmt = stmt.with_for_update(of=Note)
+    # unique(): `options` may join collections, one row per element
+    if must_be_owner:
+        note = db.scalars(stmt).unique().one_or_none()
+        shared = False
+    else:
+        row = db.execute(stmt.add_columns(_is_shared(user_id))).unique().one_or_none()
+        note, shared = row if row else (None, False)
+
+    if note is None:
+        return None, NOT_FOUND
+    if note.user_id == user_id:
+        return note, None
+    if must_be_owner or not (note.is_public or shared):
+        return note, FORBIDDEN
+    return note, None
+
@@ -0,0 +1,251 @@
+"""
+Content-addressed storage of large note bodies.
+
+A body of CONTENT_BLOB_MIN_BYTES or more (UTF-8) is not kept in
+`notes.content`: it is stored compressed in `content_blobs` under its
+sha256, and the note keeps the hash in `content_hash` and the first
+CONTENT_PREVIEW_CHARS characters in `content`. Identical bodies (a
+template copied into every account, an import run twice) are stored and
+compressed once; a blob counts the notes pointing at it and is deleted
+with the last one. Blobs are compressed with zstd when the `zstandard`
+package is installed and with zlib otherwise; the codec is stored with
+each blob, so both can be read whichever is installed.
+
+Scans of `notes` read short rows, and full bodies are fetched only for the
+notes being returned: `bodies` reads those of a page in one query, and
+`content_of` those of ORM notes loaded with `selectinload(Note.blob)`. A
+hash always names the same body, so decompressed bodies are cached per
+process without invalidation.
+
+Bodies written inline before they crossed the threshold (or before this
+table existed) stay valid; they are moved to blobs with
+
+    python -m app.blobs
+"""
+import hashlib
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session, object_session
+
+from app.cache import TTLCache
+from app.config.db import upsert_insert
+from app.config.settings import settings
+from app.models.blob import ContentBlob
+from app.models.note import Note
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# (content as stored in notes.content, content_hash)
+Stored = Tuple[Optional[str], Optional[str]]
+
+_bodies = TTLCache(settings.CONTENT_CACHE_SIZE, settings.CONTENT_CACHE_TTL_SECONDS)
+
+
+def _compress(raw: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(
+            level=settings.CONTENT_ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise LookupError(f"Cannot decompress a {codec!r} content blob")
+
+
+def _body(content_hash: str, codec: str, data: bytes) -> str:
+    body = _bodies.get(content_hash)
+    if body is None:
+        body = _decompress(codec, data).decode()
+        _bodies.set(content_hash, body)
+    return body
+
+
+def _split(content: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[bytes]]:
+    """(stored content, hash, encoded body); the hash is None for a body
+    kept inline."""
+    if content is None:
+        return None, None, None
+    raw = content.encode()
+    if len(raw) < settings.CONTENT_BLOB_MIN_BYTES:
+        return content, None, None
+    return content[:settings.CONTENT_PREVIEW_CHARS], hashlib.sha256(raw).hexdigest(), raw
+
+
+def _add_refs(db: Session, counts: Counter, raw: Dict[str, bytes]) -> None:
+    """Adds `counts` (hash -> new references) to the blobs, creating the
+    missing ones. Only the bodies not stored yet are compressed."""
+    by_count = defaultdict(list)
+    for content_hash, count in counts.items():
+        by_count[count].append(content_hash)
+    existing = set()
+    for count, group in by_count.items():
+        existing.update(db.scalars(
+            update(ContentBlob)
+            .where(ContentBlob.hash.in_(group))
+            .values(refcount=ContentBlob.refcount + count)
+            .returning(ContentBlob.hash)
+            .execution_options(synchronize_session=False)
+        ))
+
+    rows = []
+    for content_hash in counts.keys() - existing:
+        codec, data = _compress(raw[content_hash])
+        rows.append({"hash": content_hash, "size": len(raw[content_hash]),
+                     "codec": codec, "data": data, "refcount": counts[content_hash]})
+    if not rows:
+        return
+    stmt = upsert_insert(db, ContentBlob)
+    if stmt is None:
+        db.execute(insert(ContentBlob), rows)
+        return
+    # A concurrent transaction may have created the same blob meanwhile
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["hash"],
+            set_={"refcount": ContentBlob.refcount + stmt.excluded.refcount},
+        ),
+        rows,
+    )
+
+
+def store_many(db: Session, contents: Sequence[Optional[str]]) -> List[Stored]:
+    """
+    The (content, content_hash) values to write for each of `contents`,
+    with a reference added to the blob of every large one. Bodies below
+    the threshold cost no statement. Does not commit.
+    """
+    split = [_split(content) for content in contents]
+    raw = {content_hash: body for _, content_hash, body in split if content_hash}
+    if raw:
+        _add_refs(db, Counter(h for _, h, _ in split if h), raw)
+        for content, (_, content_hash, _) in zip(contents, split):
+            if content_hash:
+                _bodies.set(content_hash, content)
+    return [(stored, content_hash) for stored, content_hash, _ in split]
+
+
+def release(db: Session, hashes: Iterable[Optional[str]]) -> None:
+    """Drops a reference to the blob of each hash (None is ignored) and
+    deletes the blobs left without any. Does not commit."""
+    counts = Counter(h for h in hashes if h)
+    if not counts:
+        return
+    by_count = defaultdict(list)
+    for content_hash, count in counts.items():
+        by_count[count].append(content_hash)
+    for count, group in by_count.items():
+        db.execute(
+            update(ContentBlob)
+            .where(ContentBlob.hash.in_(group))
+            .values(refcount=ContentBlob.refcount - count)
+            .execution_options(synchronize_session=False)
+        )
+    db.execute(
+        delete(ContentBlob)
+        .where(ContentBlob.hash.in_(list(counts)), ContentBlob.refcount <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def set_content(db: Session, note: Note, content: Optional[str]) -> None:
+    """Sets the content of an ORM note, moving its blob reference. Does not
+    commit."""
+    old_hash = note.content_hash
+    [(note.content, note.content_hash)] = store_many(db, [content])
+    release(db, [old_hash])
+
+
+def bodies(db: Session, hashes: Iterable[Optional[str]]) -> Dict[str, str]:
+    """The bodies of the blobs of `hashes` (None is ignored), reading the
+    ones not cached in one query."""
+    found, missing = {}, []
+    for content_hash in {h for h in hashes if h}:
+        body = _bodies.get(content_hash)
+        if body is None:
+            missing.append(content_hash)
+        else:
+            found[content_hash] = body
+    if missing:
+        for content_hash, codec, data in db.execute(
+            select(ContentBlob.hash, ContentBlob.codec, ContentBlob.data)
+            .where(ContentBlob.hash.in_(missing))
+        ):
+            found[content_hash] = _body(content_hash, codec, data)
+    return found
+
+
+def resolve(db: Session, stored: Sequence[Stored]) -> List[Optional[str]]:
+    """Full contents of (content, content_hash) rows, in one query at most."""
+    found = bodies(db, (content_hash for _, content_hash in stored))
+    return [found.get(content_hash, content) if content_hash else content
+            for content, content_hash in stored]
+
+
+def content_of(note: Note) -> Optional[str]:
+    """Full content of an ORM note. Its blob is read from `note.blob` when
+    loaded (`selectinload(Note.blob)`), from the cache or with one query
+    otherwise."""
+    if note.content_hash is None:
+        return note.content
+    blob = note.__dict__.get("blob")
+    if blob is not None and blob.hash == note.content_hash:
+        return _body(blob.hash, blob.codec, blob.data)
+    return resolve(object_session(note), [(note.content, note.content_hash)])[0]
+
+
+def externalize(db: Session, batch_size: int = 1000) -> int:
+    """
+    Moves the inline bodies of CONTENT_BLOB_MIN_BYTES or more to blobs,
+    committing every `batch_size` notes. updated_at is left as is.
+    Returns the number of moved bodies.
+    """
+    notes = Note.__table__
+    moved, last_id = 0, 0
+    while True:
+        rows = db.execute(
+            select(Note.id, Note.content)
+            .where(Note.id > last_id,
+                   Note.content_hash.is_(None),
+                   # A UTF-8 character is at most 4 bytes
+                   func.length(Note.content) >= settings.CONTENT_BLOB_MIN_BYTES // 4)
+            .order_by(Note.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return moved
+        last_id = rows[-1].id
+        values = [
+            {"b_id": row.id, "b_content": content, "b_hash": content_hash}
+            for row, (content, content_hash) in zip(
+                rows, store_many(db, [row.content for row in rows]))
+            if content_hash
+        ]
+        if values:
+            db.execute(
+                update(notes)
+                .where(notes.c.id == bindparam("b_id"))
+                .values(content=bindparam("b_content"),
+                        content_hash=bindparam("b_hash"),
+                        updated_at=notes.c.updated_at),
+                values,
+            )
+        db.commit()
+        moved += len(values)
+
+
+if __name__ == "__main__":
+    from app.config.db import SessionLocal
+
+    with SessionLocal() as db:
+        moved = externalize(db)
+    print(f"Moved {moved} note bodies to content blobs")
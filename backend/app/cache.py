@@ -0,0 +1,126 @@
+"""
+In-process caches.
+
+`TTLCache` is a bounded, thread-safe LRU whose entries expire after a
+time-to-live. It is shared by the per-process caches of the API (decoded
+tokens, public notes, ...); every worker process has its own copy.
+
+`TieredCache` puts a `TTLCache` in front of an optional `CacheBackend`
+shared by all processes (Redis, memcached, ...), for values that are
+JSON-serializable.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from app.config.settings import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores `value` for `ttl` seconds (the cache default when None)."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the live entries."""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (exp, v) in self._data.items() if exp > now]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class CacheBackend:
+    """Interface of a cache shared between processes."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class TieredCache:
+    def __init__(self, prefix: str, local: TTLCache,
+                 shared: Optional[CacheBackend] = None):
+        self.prefix = prefix
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            raw = self.shared.get(self.prefix + key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(self.prefix + key, json.dumps(value), self.local.ttl)
+
+    def delete(self, key: str) -> None:
+        self.local.pop(key)
+        if self.shared is not None:
+            self.shared.delete(self.prefix + key)
+
+
+# Rendered /notes/public/{token} responses, keyed by public token. An
+# entry carries the Note.version it was rendered from and is only served
+# while the note is public and its version matches.
+public_note_cache = TieredCache(
+    "public-note:",
+    TTLCache(settings.PUBLIC_NOTE_CACHE_SIZE, settings.PUBLIC_NOTE_CACHE_TTL_SECONDS),
+)
+
+# Rendered /notes/{id} responses, keyed by note id and by whether they
+# are the owner's. An entry carries the Note.version it was rendered from
+# and is only served while it matches.
+note_cache = TieredCache(
+    "note:",
+    TTLCache(settings.NOTE_CACHE_SIZE, settings.NOTE_CACHE_TTL_SECONDS),
+)
@@ -0,0 +1,119 @@
+"""
+Response compression.
+
+`CompressionMiddleware` compresses responses of at least
+COMPRESSION_MINIMUM_SIZE bytes with brotli when the client accepts it and
+the `brotli` package is installed, with gzip otherwise. It reuses the
+responders of Starlette's GZipMiddleware, so streaming responses (the NDJSON
+endpoints) are compressed as they go. Already compressed payloads (zip
+exports) are sent as they are. A strong ETag of a response it encodes is
+made weak, since the encoded bytes differ from those the tag was computed
+from.
+"""
+from typing import Set
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.settings import settings
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "application/zip")
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Codings of an Accept-Encoding header, minus the ones with q=0."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip().removeprefix("q=")
+        try:
+            if params and float(q) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class _Excluding:
+    """Skips compression of EXCLUDED_CONTENT_TYPES and weakens the ETag of
+    the responses it encodes."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_weakened(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                etag = headers.get("etag")
+                # A 304 stands for the encoded response the client holds
+                encoded = ("content-encoding" in headers
+                           and not self.content_encoding_set)
+                if etag and not etag.startswith("W/") and (
+                        encoded or message["status"] == 304):
+                    headers["ETag"] = "W/" + etag
+            await send(message)
+
+        await super().__call__(scope, receive, send_weakened)
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] != "http.response.start":
+            await super().send_with_compression(message)
+            return
+        # Same as IdentityResponder, with our own list of content types
+        headers = Headers(raw=message["headers"])
+        self.initial_message = message
+        self.content_encoding_set = "content-encoding" in headers
+        self.content_type_is_excluded = headers.get("content-type", "").startswith(
+            EXCLUDED_CONTENT_TYPES)
+
+
+class GzipResponder(_Excluding, GZipResponder):
+    pass
+
+
+class BrotliResponder(_Excluding, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        body = self.compressor.process(body)
+        if not more_body:
+            body += self.compressor.finish()
+        return body
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_level: int = settings.GZIP_LEVEL,
+        brotli_quality: int = settings.BROTLI_QUALITY,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        responder: ASGIApp
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif "gzip" in accepted:
+            responder = GzipResponder(self.app, self.minimum_size, self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
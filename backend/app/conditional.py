@@ -0,0 +1,49 @@
+"""
+Conditional GET helpers (ETag / Last-Modified validators).
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def weak_etag(*parts) -> str:
+    """A weak validator for a representation identified by `parts`
+    (weak, so it stays valid once the body is compressed)."""
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return 'W/"' + digest + '"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        # Timestamps are stored in UTC without a zone
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str,
+                    last_modified: Optional[str] = None) -> bool:
+    """
+    True when the request's validators match, i.e. a 304 can be sent.
+    If-None-Match wins over If-Modified-Since (RFC 9110, 13.2.2).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
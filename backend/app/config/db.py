@@ -1,17 +1,131 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import Union
 
-DATABASE_URL = "sqlite:///./notes.db"
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+from .settings import settings
+
+DATABASE_URL = settings.DATABASE_URL
+
+# INSERT constructs with ON CONFLICT support, by dialect
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+# Async drivers used when settings.ASYNC_DB is enabled
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url: URL) -> dict:
+    """Pool and connection arguments for `url` built from the settings."""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": settings.DB_STATEMENT_TIMEOUT_MS / 1000,
+        }
+    elif backend == "postgresql":
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def build_engine(url: str = DATABASE_URL, **overrides):
+    url = make_url(url)
+    engine = create_engine(url, **{**engine_options(url), **overrides})
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+AnySession = Union[Session, AsyncSession]
+
+
+def to_async_url(url: str) -> URL:
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+async_engine = None
+AsyncSessionLocal = None
+if settings.ASYNC_DB:
+    _async_url = to_async_url(DATABASE_URL)
+    async_engine = create_async_engine(_async_url, **engine_options(_async_url))
+    if _async_url.get_backend_name() == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_session = get_async_db if settings.ASYNC_DB else get_db
+
+
+async def run_db(db: AnySession, fn, *args, **kwargs):
+    """
+    Runs `fn(session, *args, **kwargs)` without blocking the event loop.
+
+    With an AsyncSession the ORM code runs through `run_sync`, so every query
+    is awaited on the async driver. With a plain Session it runs in the
+    threadpool, exactly like a sync endpoint would.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def upsert_insert(db: Session, model):
+    """INSERT for `model` supporting `on_conflict_*`, or None when the
+    dialect of the session has no upsert."""
+    dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    return dialect_insert(model) if dialect_insert is not None else None
@@ -6,6 +6,81 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "test"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Verified tokens and their users are cached per process; an entry never
+    # outlives the token's exp claim
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    # bcrypt runs on a dedicated process pool (0 = request threadpool);
+    # login/register answer 503 once HASH_MAX_PENDING jobs are waiting
+    HASH_WORKERS: int = 2
+    HASH_MAX_PENDING: int = 64
+    PUBLIC_NOTE_CACHE_SIZE: int = 10000
+    PUBLIC_NOTE_CACHE_TTL_SECONDS: int = 60
+    # Rendered GET /notes/{id} responses, checked against the note's
+    # version on every hit
+    NOTE_CACHE_SIZE: int = 2000
+    NOTE_CACHE_TTL_SECONDS: int = 300
+    # Per-user tag counts behind /tags/suggest
+    TAG_SUGGEST_CACHE_SIZE: int = 10000
+    TAG_SUGGEST_CACHE_TTL_SECONDS: int = 30
+    # Note history (app.revisions): a full snapshot every
+    # REVISION_SNAPSHOT_INTERVAL revisions, deltas in between. Compaction
+    # keeps the last REVISION_RETENTION revisions of a note, and none older
+    # than REVISION_RETENTION_DAYS (0 keeps them regardless of age)
+    REVISION_SNAPSHOT_INTERVAL: int = 20
+    REVISION_RETENTION: int = 1000
+    REVISION_RETENTION_DAYS: int = 0
+    # Write-behind jobs (app.outbox): batches of up to OUTBOX_BATCH_SIZE jobs
+    # run OUTBOX_BATCH_DELAY_MS after a commit adds one; jobs left by other
+    # processes are picked up every OUTBOX_POLL_SECONDS. A failing job is
+    # retried with backoff up to OUTBOX_MAX_ATTEMPTS times. OUTBOX_WORKER=false
+    # leaves the jobs to `python -m app.outbox`
+    OUTBOX_WORKER: bool = True
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_BATCH_DELAY_MS: int = 5
+    OUTBOX_POLL_SECONDS: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # Note bodies of CONTENT_BLOB_MIN_BYTES or more are stored once per
+    # distinct body in content_blobs (app.blobs, zstd level CONTENT_ZSTD_LEVEL),
+    # the note keeping its first CONTENT_PREVIEW_CHARS characters. Decompressed
+    # bodies are cached per process
+    CONTENT_BLOB_MIN_BYTES: int = 4096
+    CONTENT_PREVIEW_CHARS: int = 500
+    CONTENT_ZSTD_LEVEL: int = 3
+    CONTENT_CACHE_SIZE: int = 1000
+    CONTENT_CACHE_TTL_SECONDS: int = 3600
+
+    DATABASE_URL: str = "sqlite:///./notes.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # Seconds before a pooled connection is replaced, -1 disables recycling
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Postgres statement_timeout; used as the lock wait (busy timeout) on SQLite
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    # Serve requests through an AsyncSession (aiosqlite/asyncpg) instead of
+    # the threadpool-bound sync Session
+    ASYNC_DB: bool = False
+    # Statements slower than this are logged with their route; Server-Timing
+    # headers expose app/db time per response
+    SLOW_QUERY_MS: int = 200
+    SERVER_TIMING: bool = True
+    # Responses of at least COMPRESSION_MINIMUM_SIZE bytes are compressed
+    # (brotli when installed and accepted, gzip otherwise)
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    # Production server (gunicorn.conf.py): WEB_CONCURRENCY=0 starts one
+    # worker per CPU; workers are replaced after WEB_MAX_REQUESTS requests
+    # (plus up to WEB_MAX_REQUESTS_JITTER) and get WEB_GRACEFUL_TIMEOUT
+    # seconds to finish their requests on shutdown
+    WEB_BIND: str = "0.0.0.0:8000"
+    WEB_CONCURRENCY: int = 0
+    WEB_MAX_REQUESTS: int = 10000
+    WEB_MAX_REQUESTS_JITTER: int = 1000
+    WEB_GRACEFUL_TIMEOUT: int = 30
+    WEB_KEEPALIVE: int = 5
     
     
     model_config = SettingsConfigDict(
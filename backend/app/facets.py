@@ -0,0 +1,234 @@
+"""
+Per-user aggregates behind /notes/facets.
+
+`user_tag_counts` holds the number of notes of a user per tag and
+`user_note_stats` the number of notes of a user per visibility, so reading
+the facets costs O(tags) instead of a scan of the user's notes. Visibility
+counts are adjusted in the transaction that changes the notes. Tag counts
+are adjusted by a write-behind job (app.outbox) that `app.tags` adds to
+that transaction, which groups the deltas of concurrent requests.
+
+`user_note_stats.version` counts the writes to a user's notes; with their
+number and latest `updated_at` it makes up the `collection_version` the
+notes list is validated against. `rebuild` recomputes the aggregates from
+scratch:
+
+    python -m app.facets
+"""
+from collections import Counter, defaultdict
+from typing import List, Mapping, Optional, Sequence
+
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from app import outbox
+from app.config.db import upsert_insert
+from app.models.auth import User
+from app.models.facets import UserNoteStats, UserTagCount
+from app.models.note import Note, NoteTag, SharedNote, Tag
+from app.tag_suggest import forget_user
+
+VISIBILITIES = ("public", "shared", "private")
+
+TAG_COUNTS = "facets.tag_counts"
+
+
+def visibility(is_public: bool, has_shares: bool) -> str:
+    """Same rule as `get_visibility` in the notes router."""
+    if is_public:
+        return "public"
+    return "shared" if has_shares else "private"
+
+
+def has_shares(db: Session, note_id: int) -> bool:
+    return db.scalar(select(exists().where(SharedNote.note_id == note_id)))
+
+
+def _upsert_add(db: Session, model, keys: Sequence[str], rows: List[dict],
+                columns: Sequence[str]) -> None:
+    """Adds the values of `columns` in `rows` to the existing rows, creating
+    the missing ones."""
+    stmt = upsert_insert(db, model)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in columns},
+        )
+        db.execute(stmt, rows)
+        return
+    for row in rows:
+        result = db.execute(
+            update(model)
+            .where(*(getattr(model, k) == row[k] for k in keys))
+            .values({c: getattr(model, c) + row[c] for c in columns})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(model).values(row))
+
+
+def adjust_tag_counts(db: Session, user_id: int, deltas: Mapping[int, int]) -> None:
+    """Adds `deltas` (tag id -> change) to the tag counts of the user."""
+    rows = [
+        {"user_id": user_id, "tag_id": tag_id, "count": delta}
+        for tag_id, delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    forget_user(user_id)
+    _upsert_add(db, UserTagCount, ("user_id", "tag_id"), rows, ["count"])
+    if any(r["count"] < 0 for r in rows):
+        db.execute(
+            delete(UserTagCount).where(
+                UserTagCount.user_id == user_id,
+                UserTagCount.count <= 0,
+            )
+        )
+
+
+def queue_tag_counts(db: Session, user_id: int, deltas: Mapping[int, int]) -> None:
+    """`adjust_tag_counts` once the session's transaction is committed."""
+    deltas = [[tag_id, delta] for tag_id, delta in deltas.items() if delta]
+    if deltas:
+        outbox.enqueue(db, TAG_COUNTS, {"user_id": user_id, "deltas": deltas})
+
+
+@outbox.handler(TAG_COUNTS)
+def _run_tag_counts(db: Session, payloads: List[dict]) -> None:
+    deltas = defaultdict(Counter)
+    for payload in payloads:
+        for tag_id, delta in payload["deltas"]:
+            deltas[payload["user_id"]][tag_id] += delta
+    # The user may have been deleted since
+    users = db.scalars(select(User.id).where(User.id.in_(list(deltas))))
+    for user_id in users:
+        adjust_tag_counts(db, user_id, deltas[user_id])
+
+
+def move_notes(
+    db: Session,
+    user_id: int,
+    old: Optional[str],
+    new: Optional[str],
+    count: int = 1,
+) -> None:
+    """
+    Moves `count` notes of the user from visibility `old` to `new`; `old`
+    is None for created notes and `new` is None for deleted ones.
+    """
+    if count == 0:
+        return
+    if old == new:
+        touch(db, user_id)
+        return
+    row = {"user_id": user_id, "version": 1,
+           **{f"{v}_notes": 0 for v in VISIBILITIES}}
+    if old is not None:
+        row[f"{old}_notes"] -= count
+    if new is not None:
+        row[f"{new}_notes"] += count
+    _upsert_add(db, UserNoteStats, ("user_id",), [row],
+                ["version", *(f"{v}_notes" for v in VISIBILITIES)])
+
+
+def touch(db: Session, user_id: int) -> None:
+    """Records a write to the user's notes that moves no note (an edit, a
+    retag, a share of an already shared note...). `move_notes` does it
+    for the others."""
+    _upsert_add(db, UserNoteStats, ("user_id",),
+                [{"user_id": user_id, "version": 1}], ["version"])
+
+
+def collection_version(db: Session, user_id: int) -> tuple:
+    """
+    (number of notes, latest updated_at, write counter) of the user's notes,
+    from the (user_id, updated_at, id) index and one user_note_stats row.
+    """
+    version = (
+        select(UserNoteStats.version)
+        .where(UserNoteStats.user_id == user_id)
+        .scalar_subquery()
+    )
+    return tuple(db.execute(
+        select(func.count(), func.max(Note.updated_at), version)
+        .where(Note.user_id == user_id)
+    ).one())
+
+
+def get_facets(db: Session, user_id: int) -> dict:
+    stats = db.get(UserNoteStats, user_id)
+    counts = {v: getattr(stats, f"{v}_notes") if stats else 0 for v in VISIBILITIES}
+    tags = db.execute(
+        select(Tag.tag_name, UserTagCount.count)
+        .join(Tag, Tag.id == UserTagCount.tag_id)
+        .where(UserTagCount.user_id == user_id, UserTagCount.count > 0)
+        .order_by(UserTagCount.count.desc(), Tag.tag_name)
+    ).all()
+    return {
+        "total": sum(counts.values()),
+        "visibility": counts,
+        "tags": [{"tag_name": name, "count": count} for name, count in tags],
+    }
+
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> None:
+    """Recomputes the aggregates of one user, or of everyone. Does not
+    commit."""
+    def scoped(stmt, column):
+        return stmt if user_id is None else stmt.where(column == user_id)
+
+    # Apply the pending jobs first, or their tag count deltas would land
+    # on top of the recomputed counts
+    while outbox.process(db):
+        pass
+
+    db.execute(scoped(delete(UserTagCount), UserTagCount.user_id))
+
+    db.execute(insert(UserTagCount).from_select(
+        ["user_id", "tag_id", "count"],
+        scoped(
+            select(Note.user_id, NoteTag.tag_id, func.count())
+            .join(NoteTag, NoteTag.note_id == Note.id),
+            Note.user_id,
+        ).group_by(Note.user_id, NoteTag.tag_id),
+    ))
+
+    shared = exists().where(SharedNote.note_id == Note.id)
+    private = Note.is_public == False  # noqa: E712
+    counts = scoped(
+        select(
+            Note.user_id,
+            func.sum(case((Note.is_public == True, 1), else_=0)).label("public_notes"),  # noqa: E712
+            func.sum(case((and_(private, shared), 1), else_=0)).label("shared_notes"),
+            func.sum(case((and_(private, ~shared), 1), else_=0)).label("private_notes"),
+        ),
+        Note.user_id,
+    ).group_by(Note.user_id).subquery()
+    columns = [f"{v}_notes" for v in VISIBILITIES]
+
+    # The rows are kept and their version bumped, not recreated: a version
+    # that went back could match an ETag a client got before the rebuild
+    db.execute(
+        scoped(update(UserNoteStats), UserNoteStats.user_id)
+        .values(version=UserNoteStats.version + 1, **{c: 0 for c in columns})
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(UserNoteStats)
+        .where(UserNoteStats.user_id == counts.c.user_id)
+        .values(**{c: counts.c[c] for c in columns})
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(insert(UserNoteStats).from_select(
+        ["user_id", *columns, "version"],
+        select(counts, literal(1)).where(~exists().where(
+            UserNoteStats.user_id == counts.c.user_id)),
+    ))
+
+
+if __name__ == "__main__":
+    from app.config.db import SessionLocal
+
+    with SessionLocal() as db:
+        rebuild(db)
+        db.commit()
+    print("Rebuilt note facets")
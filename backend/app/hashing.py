@@ -0,0 +1,94 @@
+"""
+Password hashing off the request path.
+
+bcrypt is CPU bound: run on the request threads, a burst of logins takes
+every threadpool slot and stalls unrelated endpoints. Hashing therefore
+runs on a dedicated process pool of `HASH_WORKERS` processes. At most
+`HASH_MAX_PENDING` jobs may wait for it; past that, requests fail fast
+with 503 instead of queueing without bound.
+
+With HASH_WORKERS=0 hashing runs in the request threadpool instead.
+"""
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+
+from app.config.settings import settings
+from app.metrics import counter, histogram
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+hash_latency = histogram(
+    "password_hash_seconds",
+    "Time to hash or verify a password, queueing included",
+)
+hash_rejected = counter(
+    "password_hash_rejected_total",
+    "Hashing jobs rejected because the queue was full",
+)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def _run(self, operation: str, fn, *args):
+        if self.pending >= self.max_pending:
+            hash_rejected.inc(operation=operation)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                return await run_in_threadpool(fn, *args)
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._executor(), fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM killed); start a fresh pool once
+                self.shutdown()
+                return await loop.run_in_executor(self._executor(), fn, *args)
+        finally:
+            self.pending -= 1
+            hash_latency.observe(time.perf_counter() - start, operation=operation)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", _verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+hasher = PasswordHasher(settings.HASH_WORKERS, settings.HASH_MAX_PENDING)
@@ -1,19 +1,28 @@
 import jwt
+import time
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.cache import TTLCache
+from app.config.db import AnySession, get_session, run_db
 from app.config.settings import settings
+from app.hashing import pwd_context
+from app.models.auth import User
+from app.schemaes.auth import CurrentUser
 
 # Secret key to encode and decode JWT tokens
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# token -> CurrentUser, for tokens whose signature has been verified
+_auth_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -37,4 +46,65 @@ def decode_access_token(token: str):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+) -> CurrentUser:
+    """
+    Resolves the bearer token to its user.
+
+    The signature check and the user lookup only run on a cache miss; the
+    cached entry expires with the token's `exp` claim at the latest (after
+    AUTH_CACHE_TTL_SECONDS for a token without one).
+    """
+    user = _auth_cache.get(token)
+    if user is not None:
+        return user
+
+    payload = decode_access_token(token)
+    try:
+        user_id = int(payload["user_id"])
+    except (KeyError, TypeError, ValueError):
+        raise _credentials_exception()
+
+    def load(db: Session):
+        row = db.get(User, user_id)
+        if row is None:
+            return None
+        return CurrentUser(
+            id=row.id,
+            email=row.email,
+            first_name=row.first_name,
+            last_name=row.last_name,
+        )
+
+    user = await run_db(session, load)
+    if user is None:
+        raise _credentials_exception()
+    exp = payload.get("exp")
+    _auth_cache.set(token, user, None if exp is None else exp - time.time())
+    return user
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drops every cached token of `user_id`."""
+    for token, user in _auth_cache.items():
+        if user.id == user_id:
+            _auth_cache.pop(token)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    invalidate_user(target.id)
@@ -0,0 +1,132 @@
+"""
+Minimal in-process metrics.
+
+Counters and histograms are registered by name in `REGISTRY`. Histograms
+use cumulative buckets like Prometheus, so they can be exported as they are
+by `render_prometheus` (served at /metrics). The registry is per process.
+"""
+import bisect
+import threading
+from typing import Dict, Sequence, Tuple, Union
+
+# Seconds, from sub-millisecond DB calls to slow bcrypt rounds
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [count per bucket..., +Inf count, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[Tuple[Tuple[str, str], ...], dict]:
+        """Per label set: cumulative bucket counts, count and sum."""
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        result = {}
+        for key, values in series.items():
+            cumulative, total = [], 0
+            for count in values[:-1]:
+                total += count
+                cumulative.append(total)
+            result[key] = {
+                "buckets": list(zip(self.buckets + (float("inf"),), cumulative)),
+                "count": total,
+                "sum": values[-1],
+            }
+        return result
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        data = self.snapshot().get(tuple(sorted(labels.items())))
+        if not data or not data["count"]:
+            return 0.0
+        rank = q * data["count"]
+        for bound, cumulative in data["buckets"]:
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._series: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        with self._lock:
+            return dict(self._series)
+
+
+REGISTRY: Dict[str, Union[Counter, Histogram]] = {}
+
+
+def histogram(name: str, description: str, **kwargs) -> Histogram:
+    if name not in REGISTRY:
+        REGISTRY[name] = Histogram(name, description, **kwargs)
+    return REGISTRY[name]
+
+
+def counter(name: str, description: str) -> Counter:
+    if name not in REGISTRY:
+        REGISTRY[name] = Counter(name, description)
+    return REGISTRY[name]
+
+
+def _labels(key: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text format (0.0.4)."""
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f"# HELP {name} {metric.description}")
+        if isinstance(metric, Histogram):
+            lines.append(f"# TYPE {name} histogram")
+            for key, data in sorted(metric.snapshot().items()):
+                for bound, count in data["buckets"]:
+                    lines.append(f"{name}_bucket{_labels(key, le=_number(bound))} {count}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(data['sum'])}")
+                lines.append(f"{name}_count{_labels(key)} {data['count']}")
+        else:
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(metric.snapshot().items()):
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -1,2 +1,6 @@
 from .auth import User
-from .note import Note, NoteTag, SharedNote, Tag
\ No newline at end of file
+from .facets import UserNoteStats, UserTagCount
+from .note import Note, NoteTag, SharedNote, Tag
+from .revision import NoteRevision
+from .outbox import OutboxJob
+from .blob import ContentBlob
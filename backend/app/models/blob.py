@@ -0,0 +1,21 @@
+from sqlalchemy import Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.config.db import Base
+
+
+class ContentBlob(Base):
+    """
+    A large note body, stored once however many notes have it (maintained
+    by app.blobs). `hash` is the sha256 of the UTF-8 body, `data` the body
+    compressed with `codec`, and `refcount` the number of notes pointing
+    at it through `Note.content_hash`.
+    """
+    __tablename__ = "content_blobs"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # Uncompressed size in bytes
+    size: Mapped[int] = mapped_column(Integer)
+    codec: Mapped[str] = mapped_column(String(16))
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    refcount: Mapped[int] = mapped_column(Integer, server_default="0")
@@ -0,0 +1,37 @@
+from sqlalchemy import ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.config.db import Base
+
+
+class UserTagCount(Base):
+    """Number of notes of a user carrying a tag (maintained by app.facets)."""
+    __tablename__ = "user_tag_counts"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    tag_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("tags.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    count: Mapped[int] = mapped_column(Integer, server_default="0")
+
+
+class UserNoteStats(Base):
+    """Number of notes of a user by visibility (maintained by app.facets)."""
+    __tablename__ = "user_note_stats"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    public_notes: Mapped[int] = mapped_column(Integer, server_default="0")
+    shared_notes: Mapped[int] = mapped_column(Integer, server_default="0")
+    private_notes: Mapped[int] = mapped_column(Integer, server_default="0")
+    # Bumped by every write to the user's notes (see app.facets.touch)
+    version: Mapped[int] = mapped_column(Integer, server_default="0")
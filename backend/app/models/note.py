@@ -10,15 +10,38 @@ from sqlalchemy import (
     Text,
     TIMESTAMP,
     func,
-    Integer
+    Integer,
+    text,
 )
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from app.config.db import Base
 import uuid
 from uuid import UUID
 
+# SQLite stores CURRENT_TIMESTAMP as whole seconds; write and bind datetimes
+# in the same text format so range comparisons (keyset cursors) are exact.
+Timestamp = TIMESTAMP().with_variant(
+    SQLITE_DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d "
+                       "%(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        # Keyset pagination of a user's notes by (updated_at, id)
+        Index("idx_notes_user_updated_id", "user_id", "updated_at", "id"),
+        # The public branch of app.access.readable_note_ids
+        Index(
+            "idx_notes_public",
+            "id",
+            sqlite_where=text("is_public = 1"),
+            postgresql_where=text("is_public"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(
         Integer,
@@ -31,8 +54,11 @@ class Note(Base):
         index=True,
     )
     title: Mapped[str] = mapped_column(String(255))
+    # The body, or only its first CONTENT_PREVIEW_CHARS characters when it
+    # is stored in content_blobs under content_hash (see app.blobs)
     content: Mapped[Optional[str]] = mapped_column(Text)
-    
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
     is_public: Mapped[bool] = mapped_column(
         Boolean,
         server_default="0",
@@ -44,14 +70,17 @@ class Note(Base):
         nullable=True
     )
     created_at: Mapped[datetime] = mapped_column(
-        TIMESTAMP,
+        Timestamp,
         server_default=func.current_timestamp(),
     )
     updated_at: Mapped[datetime] = mapped_column(
-        TIMESTAMP,
+        Timestamp,
         server_default=func.current_timestamp(),
         onupdate=func.current_timestamp(),
     )
+    # Bumped by every change of what GET /notes/{id} returns, tags, shares
+    # and public link included; the version of its cached responses
+    version: Mapped[int] = mapped_column(Integer, server_default="0")
 
     # Relationships
     owner: Mapped["User"] = relationship(back_populates="notes")
@@ -63,6 +92,11 @@ class Note(Base):
         back_populates="note",
         cascade="all, delete-orphan",
     )
+    # Refcounted rather than owned, hence no foreign key
+    blob: Mapped[Optional["ContentBlob"]] = relationship(
+        primaryjoin="foreign(Note.content_hash) == ContentBlob.hash",
+        viewonly=True,
+    )
 
 
 class Tag(Base):
@@ -73,6 +107,8 @@ class Tag(Base):
         primary_key=True,
         autoincrement=True,
     )
+    # Always stored normalized (app.tags.normalize_tag) so lookups can use
+    # the unique index instead of lower(tag_name)
     tag_name: Mapped[str] = mapped_column(
         String(50),
         unique=True,
@@ -118,6 +154,8 @@ class SharedNote(Base):
             "shared_with_user_id",
             unique=True,
         ),
+        # Notes shared with a user, answered from the index alone
+        Index("idx_shared_with_note", "shared_with_user_id", "note_id"),
     )
 
     id: Mapped[int] = mapped_column(
@@ -138,10 +176,9 @@ class SharedNote(Base):
     shared_with_user_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
-        index=True,
     )
     shared_at: Mapped[datetime] = mapped_column(
-        TIMESTAMP,
+        Timestamp,
         server_default=func.current_timestamp(),
     )
 
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.config.db import Base
+from app.models.note import Timestamp
+
+
+class OutboxJob(Base):
+    """
+    A follow-up write (maintained by app.outbox), committed in the same
+    transaction as the write it follows up on and deleted by the one that
+    runs it.
+    """
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+    topic: Mapped[str] = mapped_column(String(64))
+    payload: Mapped[dict] = mapped_column(JSON)
+    # Failed runs; the job is retried from `available_at`
+    attempts: Mapped[int] = mapped_column(Integer, server_default="0")
+    available_at: Mapped[datetime] = mapped_column(
+        Timestamp,
+        server_default=func.current_timestamp(),
+    )
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from sqlalchemy import Boolean, ForeignKey, Index, Integer, LargeBinary, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.config.db import Base
+from app.models.note import Timestamp
+
+
+class NoteRevision(Base):
+    """
+    One version of a note's title and content (maintained by
+    app.revisions). `data` is a compressed snapshot of the version, or a
+    compressed delta against the previous revision.
+    """
+    __tablename__ = "note_revisions"
+    __table_args__ = (
+        Index("idx_note_revisions_note_number", "note_id", "number", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+    note_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("notes.id", ondelete="CASCADE", onupdate="CASCADE"),
+    )
+    # 1, 2, ... per note
+    number: Mapped[int] = mapped_column(Integer)
+    is_snapshot: Mapped[bool] = mapped_column(Boolean, server_default="0")
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(
+        Timestamp,
+        server_default=func.current_timestamp(),
+    )
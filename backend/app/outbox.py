@@ -0,0 +1,265 @@
+"""
+Write-behind jobs.
+
+Secondary writes that no response depends on (full-text index entries,
+per-user tag counts) are not made by the requests themselves. A request adds
+a job to the `outbox` table in its own transaction, so the job exists if and
+only if the write it follows up on is committed. After the commit the
+`OutboxWorker` of the process is woken up; it waits OUTBOX_BATCH_DELAY_MS
+for the jobs of concurrent requests, claims up to OUTBOX_BATCH_SIZE of
+them (DELETE ... RETURNING, SKIP LOCKED on Postgres) and runs them in that
+same transaction. Handlers get every payload of their topic in the batch,
+so a batch costs a few statements whatever its size.
+
+Delivery is at least once: jobs outlive a crash or a restart and are
+picked up by whichever process polls next (every OUTBOX_POLL_SECONDS).
+When a batch fails its jobs are retried one by one, and a failing job is
+retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS times, after
+which it is left in the table for inspection.
+
+Nothing runs outside the database: `run_pending()` runs the due jobs
+synchronously (tests, scripts, OUTBOX_WORKER=false), and so does
+
+    python -m app.outbox
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config.db import SessionLocal
+from app.config.settings import settings
+from app.metrics import counter, histogram
+from app.models.outbox import OutboxJob
+
+logger = logging.getLogger(__name__)
+
+# fn(db, payloads) for every job of a topic in a batch
+Handler = Callable[[Session, List[dict]], None]
+
+_handlers: Dict[str, Handler] = {}
+
+jobs_total = counter(
+    "outbox_jobs_total",
+    "Write-behind jobs run, by topic and outcome",
+)
+batch_latency = histogram(
+    "outbox_batch_seconds",
+    "Time to run a batch of write-behind jobs",
+)
+
+
+def handler(topic: str):
+    """Registers the handler of `topic`. It runs in the transaction that
+    deletes the jobs and must not commit."""
+    def register(fn: Handler) -> Handler:
+        _handlers[topic] = fn
+        return fn
+    return register
+
+
+def enqueue(db: Session, topic: str, payload: dict) -> None:
+    """Adds a job to the session's transaction; it runs after the commit."""
+    # Set here rather than by the database: `_due` compares it with the
+    # clock of this process, as the retries do
+    db.add(OutboxJob(topic=topic, payload=payload, available_at=datetime.utcnow()))
+    db.info["outbox_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(db: Session) -> None:
+    if db.info.pop("outbox_pending", False):
+        worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(db: Session) -> None:
+    db.info.pop("outbox_pending", None)
+
+
+def _due():
+    return (
+        (OutboxJob.attempts < settings.OUTBOX_MAX_ATTEMPTS)
+        & (OutboxJob.available_at <= datetime.utcnow())
+    )
+
+
+def _run(db: Session, claimed) -> List[Tuple[int, str]]:
+    """Runs the claimed (id, topic, payload) rows, in id order."""
+    jobs = sorted(claimed)
+    payloads = defaultdict(list)
+    for _, topic, payload in jobs:
+        payloads[topic].append(payload)
+    for topic, items in payloads.items():
+        fn = _handlers.get(topic)
+        if fn is None:
+            raise LookupError(f"No handler for outbox topic {topic!r}")
+        fn(db, items)
+    return [(job_id, topic) for job_id, topic, _ in jobs]
+
+
+def _claim(db: Session, where) -> list:
+    return db.execute(
+        delete(OutboxJob)
+        .where(where)
+        .returning(OutboxJob.id, OutboxJob.topic, OutboxJob.payload)
+    ).all()
+
+
+def _process(db: Session, limit: int) -> List[Tuple[int, str]]:
+    due = (
+        select(OutboxJob.id)
+        .where(_due())
+        .order_by(OutboxJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return _run(db, _claim(db, OutboxJob.id.in_(due)))
+
+
+def process(db: Session, limit: int = settings.OUTBOX_BATCH_SIZE) -> int:
+    """
+    Claims up to `limit` due jobs and runs them in the session's
+    transaction. Returns the number of jobs. Does not commit.
+    """
+    return len(_process(db, limit))
+
+
+def _count(jobs: List[Tuple[int, str]], outcome: str) -> None:
+    for topic, count in Counter(topic for _, topic in jobs).items():
+        jobs_total.inc(count, topic=topic, outcome=outcome)
+
+
+def _run_one_by_one(limit: int) -> int:
+    """Runs the due jobs of a failed batch in a transaction each. Returns
+    the number of jobs tried."""
+    with SessionLocal() as db:
+        due = db.execute(
+            select(OutboxJob.id, OutboxJob.topic, OutboxJob.attempts)
+            .where(_due())
+            .order_by(OutboxJob.id)
+            .limit(limit)
+        ).all()
+    for job_id, topic, attempts in due:
+        with SessionLocal() as db:
+            try:
+                done = _run(db, _claim(db, (OutboxJob.id == job_id) & _due()))
+                db.commit()
+                _count(done, "done")
+                continue
+            except Exception:
+                db.rollback()
+                logger.exception("Outbox job %s (%s) failed", job_id, topic)
+            db.execute(
+                update(OutboxJob)
+                .where(OutboxJob.id == job_id)
+                .values(attempts=OutboxJob.attempts + 1,
+                        available_at=datetime.utcnow() + timedelta(seconds=2 ** attempts))
+            )
+            db.commit()
+        _count([(job_id, topic)], "failed")
+        if attempts + 1 >= settings.OUTBOX_MAX_ATTEMPTS:
+            logger.error("Outbox job %s (%s) failed %d times, giving up",
+                         job_id, topic, attempts + 1)
+    return len(due)
+
+
+def run_pending(limit: int = settings.OUTBOX_BATCH_SIZE) -> int:
+    """
+    Runs the due jobs, in transactions of up to `limit` jobs, until none is
+    left. Returns the number of jobs run or retried.
+    """
+    total = 0
+    while True:
+        start = time.perf_counter()
+        with SessionLocal() as db:
+            try:
+                done = _process(db, limit)
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.warning("Outbox batch failed, retrying its jobs one by one",
+                               exc_info=True)
+                done = None
+        if done is None:
+            count = _run_one_by_one(limit)
+        else:
+            count = len(done)
+            if done:
+                batch_latency.observe(time.perf_counter() - start)
+                _count(done, "done")
+        total += count
+        if count < limit:
+            return total
+
+
+class OutboxWorker:
+    """
+    Runs the jobs committed by this process shortly after the commit, and
+    the ones left by other processes every OUTBOX_POLL_SECONDS. Started and
+    stopped with the app (OUTBOX_WORKER).
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._loop = None
+        try:
+            # What the last requests committed
+            await run_in_threadpool(run_pending)
+        except Exception:
+            logger.exception("Outbox jobs left pending at shutdown")
+
+    def wake(self) -> None:
+        """Called after a commit that added jobs, from any thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_SECONDS)
+                # Let the jobs of concurrent requests join the batch
+                await asyncio.sleep(settings.OUTBOX_BATCH_DELAY_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await run_in_threadpool(run_pending)
+            except Exception:
+                logger.exception("Outbox worker failed")
+
+
+worker = OutboxWorker()
+
+
+if __name__ == "__main__":
+    # Handlers register with app.outbox, not with this __main__ module
+    import app.facets  # noqa: F401
+    import app.search  # noqa: F401
+    from app import outbox
+
+    print(f"Ran {outbox.run_pending()} outbox jobs")
@@ -0,0 +1,86 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are cut with a row-value comparison on the sort keys instead of an
+OFFSET, and no total is counted, so fetching page 1000 costs the same as
+fetching page 1. Every key is sorted descending and the last key must be
+unique (the primary key) to make the order total.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, List, Literal, Optional, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, literal, tuple_
+from sqlalchemy.orm import Query
+
+from app.schemaes.note import CursorPage
+
+PaginationMode = Literal["page", "cursor"]
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([
+        v.isoformat() if isinstance(v, datetime) else v for v in values
+    ])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> List:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("cursor does not match the sort keys")
+        return [
+            datetime.fromisoformat(v) if isinstance(k.type, DateTime) else v
+            for k, v in zip(keys, values)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def keyset_paginate(
+    query: Query,
+    keys: Sequence,
+    size: int,
+    cursor: Optional[str] = None,
+    transformer: Optional[Callable[[List], List]] = None,
+) -> CursorPage:
+    """
+    Returns the page of `query` that follows `cursor`, ordered by `keys`
+    descending. `next_cursor` is None on the last page.
+
+    Items are the entities of `query`, or tuples of them when the query
+    selects more than one.
+    """
+    width = len(query.column_descriptions)
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        query = query.filter(
+            tuple_(*keys) < tuple_(*(literal(v, k.type) for k, v in zip(keys, values)))
+        )
+    rows = (
+        query.add_columns(*keys)
+        .order_by(None)
+        .order_by(*(k.desc() for k in keys))
+        .limit(size + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1][-len(keys):])
+
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    return CursorPage(
+        items=transformer(items) if transformer else items,
+        size=size,
+        next_cursor=next_cursor,
+    )
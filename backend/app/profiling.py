@@ -0,0 +1,137 @@
+"""
+Request timing and SQL profiling.
+
+`ProfilingMiddleware` times every request and, through the cursor hooks
+installed on the engines by `install_query_hooks`, counts the SQL
+statements it runs and the time spent in them. The numbers end up in:
+
+  * the histograms of `app.metrics` (per route, served at /metrics),
+  * a `Server-Timing` header (`app`, `db`) readable from the browser's
+    devtools,
+  * the `app.profiling` logger for statements slower than
+    settings.SLOW_QUERY_MS, with the route that ran them.
+
+The current request is tracked in a context variable, which follows the
+ORM code into the threadpool (`run_in_threadpool` copies the context) and
+through `AsyncSession.run_sync`.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config.settings import settings
+from app.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+# Query counts per request, from a single lookup to a runaway N+1
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+request_latency = histogram(
+    "http_request_duration_seconds", "Request latency by route")
+request_db_time = histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request")
+request_queries = histogram(
+    "http_request_queries", "SQL statements run per request",
+    buckets=QUERY_COUNT_BUCKETS)
+requests_total = counter(
+    "http_requests_total", "Requests by route and status")
+query_latency = histogram(
+    "db_query_duration_seconds", "SQL statement latency by route")
+slow_queries = counter(
+    "db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS")
+
+
+@dataclass
+class RequestStats:
+    scope: dict
+    queries: int = 0
+    db_seconds: float = 0.0
+
+    @property
+    def route(self) -> str:
+        """Path template of the matched route; set once routing is done."""
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    route = stats.route if stats is not None else "background"
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    query_latency.observe(elapsed, route=route)
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        slow_queries.inc(route=route)
+        logger.warning("slow query (%.1f ms) on %s: %s",
+                       elapsed * 1000, route, " ".join(statement.split()))
+
+
+def install_query_hooks(bind: Engine) -> None:
+    """Profiles every statement of `bind` (a sync Engine; pass
+    `async_engine.sync_engine` for the async one)."""
+    if not event.contains(bind, "before_cursor_execute", _before_cursor_execute):
+        event.listen(bind, "before_cursor_execute", _before_cursor_execute)
+        event.listen(bind, "after_cursor_execute", _after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware, so streaming responses are not buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.SERVER_TIMING:
+                    elapsed = (time.perf_counter() - start) * 1000
+                    header = (
+                        f'app;dur={elapsed:.1f}, '
+                        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                    )
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = stats.route
+            method = scope["method"]
+            request_latency.observe(time.perf_counter() - start, method=method, route=route)
+            request_db_time.observe(stats.db_seconds, method=method, route=route)
+            request_queries.observe(stats.queries, method=method, route=route)
+            requests_total.inc(method=method, route=route, status=str(status_code))
@@ -0,0 +1,19 @@
+"""
+JSON responses rendered with orjson.
+
+`ORJSONResponse` is the default response class of the app. Endpoints on the
+hot path return it directly with plain dicts built from result rows, which
+skips the `response_model` validation pass; it renders datetimes the way
+pydantic does, so both paths produce the same documents.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
@@ -0,0 +1,248 @@
+"""
+Revision history of note titles and contents.
+
+Every edit of a note records a revision. Most revisions are a delta against
+the previous one: the content is diffed line by line into a list of
+operations, either a [start, end) range of lines kept from the previous
+version or a string of new text, and stored as zlib-compressed JSON. Every
+REVISION_SNAPSHOT_INTERVAL revisions the full version is stored instead, so
+any version is rebuilt from one snapshot and fewer than
+REVISION_SNAPSHOT_INTERVAL deltas, read in one query.
+
+History starts at the first edit: it records the version before the edit
+as revision 1 (a snapshot), then the edit as revision 2.
+
+`compact` enforces the retention policy (the last REVISION_RETENTION
+revisions of a note, none older than REVISION_RETENTION_DAYS) and makes
+the oldest kept revision a snapshot:
+
+    python -m app.revisions
+"""
+import zlib
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import and_, case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config.settings import settings
+from app.models.revision import NoteRevision
+
+# (title, content)
+Version = Tuple[str, Optional[str]]
+
+
+def diff(old: str, new: str) -> list:
+    """Operations turning `old` into `new`, line by line."""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+    return ops
+
+
+def patch(old: str, ops: list) -> str:
+    lines = old.splitlines(keepends=True)
+    return "".join(
+        "".join(lines[op[0]:op[1]]) if isinstance(op, list) else op
+        for op in ops
+    )
+
+
+def _encode(payload: dict) -> bytes:
+    return zlib.compress(orjson.dumps(payload))
+
+
+def _decode(data: bytes) -> dict:
+    return orjson.loads(zlib.decompress(data))
+
+
+def _snapshot(version: Version) -> dict:
+    return {"title": version[0], "content": version[1]}
+
+
+def _delta(old: Version, new: Version) -> dict:
+    payload = {}
+    if new[0] != old[0]:
+        payload["title"] = new[0]
+    if new[1] != old[1]:
+        if new[1] is None:
+            payload["content"] = None
+        else:
+            payload["ops"] = diff(old[1] or "", new[1])
+    return payload
+
+
+def _apply(version: Optional[Version], payload: dict, is_snapshot: bool) -> Version:
+    if is_snapshot:
+        return payload["title"], payload["content"]
+    title, content = version
+    title = payload.get("title", title)
+    if "ops" in payload:
+        content = patch(content or "", payload["ops"])
+    elif "content" in payload:
+        content = payload["content"]
+    return title, content
+
+
+def _rows(db: Session, edits: Dict[int, Tuple[Version, Version]],
+          snapshot: bool = False) -> List[dict]:
+    """The revisions to insert for `edits`, numbered after the current
+    heads; every edit is stored as a snapshot if `snapshot`."""
+    heads = {
+        note_id: (last, head_snapshot)
+        for note_id, last, head_snapshot in db.execute(
+            select(
+                NoteRevision.note_id,
+                func.max(NoteRevision.number),
+                func.max(case((NoteRevision.is_snapshot == True,  # noqa: E712
+                               NoteRevision.number))),
+            )
+            .where(NoteRevision.note_id.in_(list(edits)))
+            .group_by(NoteRevision.note_id)
+        )
+    }
+
+    rows = []
+    for note_id, (old, new) in edits.items():
+        last, head_snapshot = heads.get(note_id, (None, None))
+        if last is None:
+            rows.append({"note_id": note_id, "number": 1, "is_snapshot": True,
+                         "data": _encode(_snapshot(old))})
+            last = head_snapshot = 1
+        number = last + 1
+        is_snapshot = snapshot or (
+            number - (head_snapshot or 0) >= settings.REVISION_SNAPSHOT_INTERVAL)
+        payload = _snapshot(new) if is_snapshot else _delta(old, new)
+        rows.append({"note_id": note_id, "number": number,
+                     "is_snapshot": is_snapshot, "data": _encode(payload)})
+    return rows
+
+
+def record_many(db: Session, edits: Dict[int, Tuple[Version, Version]]) -> None:
+    """
+    Records the edits (note id -> (version before, version after)) of many
+    notes with one SELECT and one multi-row INSERT. Does not commit.
+
+    Callers load the notes they edit with a row lock (FOR UPDATE), so
+    concurrent edits of a note are recorded one after the other. SQLite has
+    no row locks: there the INSERT of a concurrent edit fails, and is
+    retried once after the new head, as a snapshot since the version
+    before the edit may no longer be the head.
+    """
+    edits = {note_id: edit for note_id, edit in edits.items() if edit[0] != edit[1]}
+    if not edits:
+        return
+    try:
+        db.execute(insert(NoteRevision), _rows(db, edits))
+    except IntegrityError:
+        db.execute(insert(NoteRevision), _rows(db, edits, snapshot=True))
+
+
+def record(db: Session, note_id: int, old: Version, new: Version) -> None:
+    record_many(db, {note_id: (old, new)})
+
+
+def list_revisions(db: Session, note_id: int) -> List[dict]:
+    """The revisions of a note, newest first, without their data."""
+    rows = db.execute(
+        select(NoteRevision.number, NoteRevision.is_snapshot,
+               func.length(NoteRevision.data), NoteRevision.created_at)
+        .where(NoteRevision.note_id == note_id)
+        .order_by(NoteRevision.number.desc())
+    )
+    return [
+        {"number": number, "is_snapshot": is_snapshot, "size": size,
+         "created_at": created_at}
+        for number, is_snapshot, size, created_at in rows
+    ]
+
+
+def get_version(db: Session, note_id: int, number: int) -> Optional[dict]:
+    """Revision `number` of the note rebuilt from the snapshot before it,
+    or None when there is no such revision."""
+    snapshot = (
+        select(func.max(NoteRevision.number))
+        .where(NoteRevision.note_id == note_id,
+               NoteRevision.is_snapshot == True,  # noqa: E712
+               NoteRevision.number <= number)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(NoteRevision.number, NoteRevision.is_snapshot,
+               NoteRevision.data, NoteRevision.created_at)
+        .where(NoteRevision.note_id == note_id,
+               NoteRevision.number.between(snapshot, number))
+        .order_by(NoteRevision.number)
+    ).all()
+    if not rows or rows[-1].number != number:
+        return None
+
+    version = None
+    for row in rows:
+        version = _apply(version, _decode(row.data), row.is_snapshot)
+    return {"number": number, "title": version[0], "content": version[1],
+            "created_at": rows[-1].created_at}
+
+
+def compact(
+    db: Session,
+    note_id: Optional[int] = None,
+    keep: int = settings.REVISION_RETENTION,
+    max_age_days: int = settings.REVISION_RETENTION_DAYS,
+) -> int:
+    """
+    Deletes the revisions past the retention policy, of one note or of
+    every note, and turns the oldest remaining revision of each note into
+    a snapshot. The latest revision is always kept. Returns the number of
+    deleted revisions. Does not commit.
+    """
+    recent = NoteRevision.number
+    if max_age_days > 0:
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        recent = case((NoteRevision.created_at >= cutoff, NoteRevision.number))
+    stmt = (
+        select(NoteRevision.note_id, func.min(NoteRevision.number),
+               func.max(NoteRevision.number), func.min(recent))
+        .group_by(NoteRevision.note_id)
+    )
+    if note_id is not None:
+        stmt = stmt.where(NoteRevision.note_id == note_id)
+
+    deleted = 0
+    for revised_id, first, last, first_recent in db.execute(stmt).all():
+        first_kept = max(last - keep + 1, first_recent or last, first)
+        first_kept = min(first_kept, last)
+        if first_kept == first:
+            continue
+        version = get_version(db, revised_id, first_kept)
+        db.execute(
+            update(NoteRevision)
+            .where(NoteRevision.note_id == revised_id,
+                   NoteRevision.number == first_kept)
+            .values(is_snapshot=True,
+                    data=_encode(_snapshot((version["title"], version["content"]))))
+        )
+        deleted += db.execute(
+            delete(NoteRevision).where(and_(
+                NoteRevision.note_id == revised_id,
+                NoteRevision.number < first_kept,
+            ))
+        ).rowcount
+    return deleted
+
+
+if __name__ == "__main__":
+    from app.config.db import SessionLocal
+
+    with SessionLocal() as db:
+        deleted = compact(db)
+        db.commit()
+    print(f"Deleted {deleted} revisions")
@@ -1,10 +1,11 @@
 from fastapi import Depends, HTTPException, status
 from fastapi import APIRouter
 from sqlalchemy.orm import Session
-from app.schemaes.auth import UserAuth
+from app.schemaes.auth import CurrentUser, UserAuth
 from app.schemaes.auth import RegisterUser
-from app.config.db import get_db
-from app.helper import create_access_token, get_password_hash, verify_password, oauth2_scheme, decode_access_token
+from app.config.db import AnySession, get_session, run_db
+from app.hashing import hasher
+from app.helper import create_access_token, get_current_user
 from app.models.auth import User
 
 router = APIRouter(
@@ -14,22 +15,7 @@ router = APIRouter(
 
 
 @router.get("/me")
-def get_current_user(token: str = Depends(oauth2_scheme),
-                     db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    email: str = payload.get("sub")
-    if email is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
+async def me(user: CurrentUser = Depends(get_current_user)):
     return {
         "email": user.email,
         "first_name": user.first_name,
@@ -38,25 +24,32 @@ def get_current_user(token: str = Depends(oauth2_scheme),
 
 
 @router.post("/login")
-def login(
+async def login(
     UserSchema: UserAuth,
-    db: Session = Depends(get_db)
+    session: AnySession = Depends(get_session)
 ):
     """
     Endpoint for user login.
     """
-    user = db.query(
-        User
-    ).filter(
-        User.email == UserSchema.email
-    ).first()
+    def run(db: Session):
+        user = db.query(
+            User
+        ).filter(
+            User.email == UserSchema.email
+        ).first()
+        # Hand the connection back before hashing, bcrypt would otherwise
+        # pin a pool slot for far longer than the query
+        db.close()
+        return user
+
+    user = await run_db(session, run)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    if not verify_password(UserSchema.password, user.password):
+    if not await hasher.verify(UserSchema.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -74,26 +67,36 @@ def login(
 
 
 @router.post("/register")
-def register(
+async def register(
         user_create: RegisterUser,
-        db: Session = Depends(get_db)):
+        session: AnySession = Depends(get_session)):
+
+    def find_existing(db: Session):
+        existing_user = db.query(User).filter(
+            User.email == user_create.email).first()
+        db.close()
+        return existing_user
 
-    existing_user = db.query(User).filter(
-        User.email == user_create.email).first()
+    existing_user = await run_db(session, find_existing)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
-    hashed_password = get_password_hash(user_create.password)
-    new_user = User(
-        email=user_create.email,
-        first_name=user_create.first_name,
-        last_name=user_create.last_name,
-        password=hashed_password,
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_password = await hasher.hash(user_create.password)
+
+    def run(db: Session):
+        new_user = User(
+            email=user_create.email,
+            first_name=user_create.first_name,
+            last_name=user_create.last_name,
+            password=hashed_password,
+        )
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        return new_user.id
+
+    user_id = await run_db(session, run)
     return {"message": "User registered successfully",
-            "user_id": new_user.id}
+            "user_id": user_id}
@@ -1,32 +1,48 @@
 # app/routers/notes.py
+import json
 import secrets
-from typing import List, Optional
-from uuid import UUID
-
-from app.schemaes.auth import UserAuth
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import and_, or_, func
-
-from app.config.db import get_db
+from typing import Iterable, List, Optional, Union
+
+from app.schemaes.auth import CurrentUser
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
+from sqlalchemy import Row, exists, func, select, update
+
+from app import access, blobs, facets, revisions
+from app.cache import note_cache, public_note_cache
+from app.conditional import http_date, is_not_modified, strong_etag, weak_etag
+from app.config.db import AnySession, SessionLocal, get_session, run_db
+from app.config.settings import settings
 from app.models.note import Note, Tag, NoteTag, SharedNote
 from app.models.auth import User
-from app.helper import decode_access_token, oauth2_scheme
-from app.schemaes.note import NoteCreate, NoteOut, NoteUpdate, PublicLinkRequest, PublicLinkResponse, ShareNoteRequest, ShareNoteResponse, SharedNoteOut
+from app.helper import get_current_user
+from app.pagination import PaginationMode, keyset_paginate
+from app.responses import ORJSONResponse
+from app.search import has_terms, reindex_later, search_index
+from app.tag_suggest import forget_user
+from app.tags import normalize_tag, set_note_tags
+from app.schemaes.note import CursorPage, NoteCreate, NoteOut, NoteUpdate, PublicLinkRequest, NoteFacets, PublicLinkResponse, ShareNoteRequest, ShareNoteResponse, SharedNoteOut, TagOut
 from fastapi_pagination.ext.sqlalchemy import paginate
 from fastapi_pagination import Page, Params
 from fastapi import Query
+from fastapi.responses import StreamingResponse
 
 router = APIRouter(prefix="/notes",
                    tags=["notes"])
 
+# Rows fetched per round trip by the NDJSON streaming endpoints
+STREAM_BATCH_SIZE = 500
+
 
 def _get_note_for_user(
-    note_id: UUID,
-    token: str,
+    note_id: int,
+    user_id: int,
     db: Session,
     *,
     must_be_owner: bool = False,
+    options: Iterable = (selectinload(Note.tags),),
+    for_update: bool = False,
 ) -> Note:
     """
     Returns the note if:
@@ -34,36 +50,42 @@ def _get_note_for_user(
       * the note is public, OR
       * the note has been shared with the current user.
     If must_be_owner=True, only the first condition is accepted.
+    `options` are the loader options of the note query; `for_update`
+    locks the note row (see app.access.get_note).
     """
-    payload = decode_access_token(token)
-    user_id: int = int(payload.get("user_id"))
-    note = (
-        db.query(Note)
-        .options(selectinload(Note.tags))
-        .get(note_id)
-    )
-    if not note:
+    note, denied = access.get_note(db, user_id, note_id,
+                                   must_be_owner=must_be_owner,
+                                   options=options, for_update=for_update)
+    if denied == access.NOT_FOUND:
         raise HTTPException(status_code=404, detail="Note not found")
-
-    is_owner = note.user_id == user_id
-    if must_be_owner and not is_owner:
+    if denied:
         raise HTTPException(status_code=403, detail="Forbidden")
+    return note
 
-    if not is_owner:
-        if not note.is_public:
-            shared = (
-                db.query(SharedNote)
-                .filter(
-                    SharedNote.note_id == note_id,
-                    SharedNote.shared_with_user_id == user_id,
-                )
-                .first()
-            )
-            if not shared:
-                raise HTTPException(status_code=403, detail="Forbidden")
+
+def _get_owned_note(note_id: int, user_id: int, db: Session,
+                    for_update: bool = False) -> Note:
+    note, denied = access.get_note(db, user_id, note_id, must_be_owner=True,
+                                   for_update=for_update)
+    if denied:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found or you don't have permission"
+        )
     return note
 
 
+def _bump_versions(db: Session, note_ids: Iterable[int]) -> None:
+    """Bumps Note.version of notes whose tags or shares changed, leaving
+    their updated_at as is."""
+    db.execute(
+        update(Note)
+        .where(Note.id.in_(list(note_ids)))
+        .values(version=Note.version + 1, updated_at=Note.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
 def get_visibility(n):
     if n.is_public:
         return "public"
@@ -73,377 +95,864 @@ def get_visibility(n):
         return "private"
 
 
+def _note_out_options():
+    """Loader options for everything `_note_out` reads: a fixed number of
+    queries however many notes, tags and shares there are."""
+    return (
+        selectinload(Note.tags).load_only(Tag.tag_name),
+        selectinload(Note.shared_entries)
+        .selectinload(SharedNote.shared_with_user),
+        selectinload(Note.blob),
+    )
+
+
+def _public_url(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    return f"http://127.0.0.1:8000/api/notes/public/{token}"
+
+
+def _note_out(n: Note, is_owner: bool = True) -> NoteOut:
+    """The note as seen by its owner, or by a reader (`is_owner=False`):
+    readers get neither the recipients nor the public link."""
+    shared_with = [
+        {
+            "id": s.shared_with_user.id,
+            "email": s.shared_with_user.email,
+            "first_name": s.shared_with_user.first_name,
+            "last_name": s.shared_with_user.last_name,
+            "shared_at" : s.shared_at
+        }
+        for s in n.shared_entries
+    ] if is_owner else []
+    token = n.public_token if is_owner else None
+    return NoteOut(
+        id=n.id,
+        title=n.title,
+        content=blobs.content_of(n),
+        visibility=get_visibility(n),
+        created_at=n.created_at,
+        updated_at=n.updated_at,
+        tags=[t.tag_name for t in n.tags],
+        shareToken=token,
+        sharedWith=shared_with if shared_with else None,
+        publicUrl=_public_url(token),
+    )
+
+
+# Columns read by the listing endpoints, which serialize rows directly.
+# `snippet` is the stored preview of the content (app.blobs): it is read
+# from the notes row alone, never from content_blobs.
+_NOTE_COLUMNS = {
+    "id": Note.id,
+    "user_id": Note.user_id,
+    "title": Note.title,
+    "content": Note.content,
+    "content_hash": Note.content_hash,
+    "snippet": func.substr(Note.content, 1, settings.CONTENT_PREVIEW_CHARS),
+    "is_public": Note.is_public,
+    "public_token": Note.public_token,
+    "created_at": Note.created_at,
+    "updated_at": Note.updated_at,
+}
+# Fields a note listing can be narrowed to with `fields=`, and the columns
+# they read; tags and shares are read by one extra query each. The share
+# fields are only filled in for the owner of the note (user_id).
+NOTE_FIELDS = {
+    "id": ("id",),
+    "title": ("title",),
+    "content": ("content", "content_hash"),
+    "snippet": ("snippet",),
+    "visibility": ("is_public",),
+    "created_at": ("created_at",),
+    "updated_at": ("updated_at",),
+    "tags": (),
+    "shareToken": ("user_id", "public_token"),
+    "sharedWith": ("user_id",),
+    "publicUrl": ("user_id", "public_token"),
+}
+# The NoteOut fields, returned without `fields=`
+NOTE_OUT_FIELDS = tuple(f for f in NOTE_FIELDS if f != "snippet")
+
+
+def _parse_fields(fields: Optional[str], known: dict, default: tuple) -> tuple:
+    """The fields of a comma-separated `fields=` value, always with `id`,
+    in the order of `known`."""
+    if fields is None:
+        return default
+    requested = {f.strip() for f in fields.split(",")} - {""}
+    unknown = requested - known.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+    return tuple(f for f in known if f in requested or f == "id")
+
+
+def _column_names(columns: dict, known: dict, fields: tuple) -> List[str]:
+    """Names of the `columns` read by `fields`, in the order of `columns`."""
+    needed = {name for f in fields for name in known[f]}
+    return [name for name in columns if name in needed]
+
+
+def _note_columns(fields: tuple = NOTE_OUT_FIELDS) -> list:
+    return [_NOTE_COLUMNS[name]
+            for name in _column_names(_NOTE_COLUMNS, NOTE_FIELDS, fields)]
+
+
+NOTE_COLUMNS = tuple(_note_columns())
+
+
+def _note_rows_out(db: Session, rows, user_id: int,
+                   fields: tuple = NOTE_OUT_FIELDS) -> List[dict]:
+    """
+    NoteOut documents, or their `fields`, as plain dicts for rows of
+    `_note_columns(fields)`, as seen by `user_id` (see `_note_out`). Tags,
+    shares and the bodies stored as blobs are read with one query each for
+    all the rows, when `fields` needs them. No ORM entity or pydantic model
+    is built.
+    """
+    names = _column_names(_NOTE_COLUMNS, NOTE_FIELDS, fields)
+    at = {name: i for i, name in enumerate(names)}
+    # Rows of a single column come back as scalars
+    rows = [row if isinstance(row, (tuple, Row)) else (row,) for row in rows]
+    ids = [row[at["id"]] for row in rows]
+    tags = {note_id: [] for note_id in ids}
+    shares = {note_id: [] for note_id in ids}
+    if ids and "tags" in fields:
+        for note_id, tag_name in db.execute(
+            select(NoteTag.note_id, Tag.tag_name)
+            .join(Tag, Tag.id == NoteTag.tag_id)
+            .where(NoteTag.note_id.in_(ids))
+        ):
+            tags[note_id].append(tag_name)
+    if ids and ("visibility" in fields or "sharedWith" in fields):
+        for note_id, *shared in db.execute(
+            select(SharedNote.note_id, User.id, User.email, User.first_name,
+                   User.last_name, SharedNote.shared_at)
+            .join(User, User.id == SharedNote.shared_with_user_id)
+            .where(SharedNote.note_id.in_(ids))
+        ):
+            shares[note_id].append(dict(zip(
+                ("id", "email", "first_name", "last_name", "shared_at"), shared)))
+    if "content" in fields:
+        contents = blobs.resolve(
+            db, [(row[at["content"]], row[at["content_hash"]]) for row in rows])
+
+    values = {
+        "id": lambda i, row: ids[i],
+        "title": lambda i, row: row[at["title"]],
+        "content": lambda i, row: contents[i],
+        "snippet": lambda i, row: row[at["snippet"]],
+        "visibility": lambda i, row: (
+            "public" if row[at["is_public"]]
+            else "shared" if shares[ids[i]] else "private"),
+        "created_at": lambda i, row: row[at["created_at"]],
+        "updated_at": lambda i, row: row[at["updated_at"]],
+        "tags": lambda i, row: tags[ids[i]],
+        "shareToken": lambda i, row: (
+            row[at["public_token"]] if row[at["user_id"]] == user_id else None),
+        "sharedWith": lambda i, row: (
+            shares[ids[i]] or None if row[at["user_id"]] == user_id else None),
+        "publicUrl": lambda i, row: (
+            _public_url(row[at["public_token"]])
+            if row[at["user_id"]] == user_id else None),
+    }
+    getters = [(field, values[field]) for field in fields]
+    return [{field: get(i, row) for field, get in getters}
+            for i, row in enumerate(rows)]
+
+
+def _page_response(page) -> ORJSONResponse:
+    """A page whose items are already plain dicts, bypassing the
+    response_model validation."""
+    return ORJSONResponse(dict(page))
+
+
+def _paginate_notes(query, keys, pagination, page, size, cursor, transformer):
+    if pagination == "cursor" or cursor:
+        return keyset_paginate(query, keys, size, cursor, transformer)
+    return paginate(
+        query.order_by(*(k.desc() for k in keys)),
+        params=Params(page=page, size=size),
+        transformer=transformer,
+    )
+
+
+def _stream_ndjson(build_query, serialize):
+    """
+    Streams every row of `build_query(db)` as one JSON document per line.
+
+    Rows are fetched `STREAM_BATCH_SIZE` at a time from a server-side cursor
+    on a session owned by the stream, so memory stays flat whatever the
+    number of rows.
+    """
+    def lines():
+        with SessionLocal() as db:
+            for row in build_query(db).yield_per(STREAM_BATCH_SIZE):
+                yield serialize(row).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.post("/", response_model=NoteOut, status_code=status.HTTP_201_CREATED)
-def create_note(
+async def create_note(
     data: NoteCreate,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
-    payload = decode_access_token(token)
-    user_id: int = int(payload.get("user_id"))
-    note = Note(
-        user_id=user_id,
-        title=data.title,
-        content=data.content,
-    )
-    db.add(note)
-    db.flush()
-
-    # Handle tags
-    for t in data.tag_names:
-        tag = db.query(Tag).filter(func.lower(
-            Tag.tag_name) == t.lower()).first()
-        if not tag:
-            tag = Tag(tag_name=t.lower())
-            db.add(tag)
-            db.flush()
-        db.add(NoteTag(note_id=note.id, tag_id=tag.id))
-
-    db.commit()
-    db.refresh(note)
-    return note
+    user_id = user.id
+
+    def run(db: Session):
+        note = Note(user_id=user_id, title=data.title)
+        blobs.set_content(db, note, data.content)
+        db.add(note)
+        db.flush()
+
+        set_note_tags(db, user_id, note.id, data.tag_names, current=())
+        facets.move_notes(db, user_id, None, "private")
+        reindex_later(db, [note.id])
+        db.commit()
+        db.refresh(note)
+        return _note_out(note)
+
+    return await run_db(session, run)
 
 
-@router.get("/", response_model=Page[NoteOut])
-def list_notes(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+@router.get("/", response_model=Union[Page[NoteOut], CursorPage[NoteOut]])
+async def list_notes(
+    request: Request,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
     page: int = Query(1, ge=1),
     size: int = Query(50, ge=1, le=100),
-) -> Page[NoteOut]:
-    payload = decode_access_token(token)
-    user_id: int = int(payload.get("user_id"))
+    pagination: PaginationMode = "page",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> Union[Page[NoteOut], CursorPage[NoteOut]]:
+    """
+    Lists the current user's notes, most recently updated first.
+    `pagination=cursor` (or any `cursor`) switches to keyset pagination on
+    (updated_at, id): no total is counted and the next page is fetched with
+    `next_cursor`.
+
+    `fields` (comma-separated, e.g. `title,tags,snippet`) narrows the items
+    to these NoteOut fields plus `id`; `snippet` is the first
+    CONTENT_PREVIEW_CHARS characters of the content. Only the columns and
+    queries the fields need are run.
+
+    Pages carry an ETag derived from the version of the user's notes
+    (`facets.collection_version`); a matching If-None-Match gets a 304
+    without loading any note.
+    """
+    user_id = user.id
+    fields = _parse_fields(fields, NOTE_FIELDS, NOTE_OUT_FIELDS)
+
+    def run(db: Session):
+        etag = weak_etag(user_id, request.url.query,
+                         *facets.collection_version(db, user_id))
+        if is_not_modified(request, etag):
+            return etag, None
+
+        stmt = db.query(*_note_columns(fields)).filter(Note.user_id == user_id)
+
+        def transform(rows):
+            return _note_rows_out(db, rows, user_id, fields)
+
+        return etag, _paginate_notes(stmt, (Note.updated_at, Note.id),
+                                     pagination, page, size, cursor, transform)
+
+    etag, result = await run_db(session, run)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if result is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response = _page_response(result)
+    response.headers.update(headers)
+    return response
+
+@router.get("/facets", response_model=NoteFacets)
+async def get_note_facets(
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Number of notes of the current user by visibility and by tag (most used
+    first), read from the counters maintained by `app.facets`.
+    """
+    def run(db: Session):
+        return facets.get_facets(db, user.id)
 
-    stmt = (
-        db.query(Note)
-        .options(
-            selectinload(Note.shared_entries),
-            selectinload(Note.tags).load_only(Tag.tag_name)
-        )
-        .filter(Note.user_id == user_id)
-    )
-    params = Params(page=page, size=size)
-
-    def transform(items):
-        result = []
-        for n in items:
-            shared_with = [
-                {
-                    "id": s.shared_with_user.id,
-                    "email": s.shared_with_user.email,
-                    "first_name": s.shared_with_user.first_name,
-                    "last_name": s.shared_with_user.last_name,
-                    "shared_at" : s.shared_at
-                }
-                for s in n.shared_entries
-            ]
-            public_url = None
-            if n.public_token:
-                public_url = f"http://127.0.0.1:8000/api/notes/public/{n.public_token}"
-
-            note_out = NoteOut(
-                id=n.id,
-                title=n.title,
-                content=n.content,
-                visibility=get_visibility(n),
-                created_at=n.created_at,
-                updated_at=n.updated_at,
-                tags=[t.tag_name for t in n.tags],
-                shareToken=n.public_token,
-                sharedWith=shared_with if shared_with else None,
-                publicUrl=public_url,
-            )
-            result.append(note_out)
-        return result
+    return await run_db(session, run)
 
-    return paginate(
-        stmt,
-        params=params,
-        transformer=transform
-    )
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(
+async def delete_note(
     note_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
-    note = _get_note_for_user(note_id, token, db, must_be_owner=True)
-    db.delete(note)
-    db.commit()
+    def run(db: Session):
+        note = _get_note_for_user(note_id, user.id, db, must_be_owner=True)
+        facets.move_notes(db, user.id, get_visibility(note), None)
+        facets.queue_tag_counts(db, user.id, {t.id: -1 for t in note.tags})
+        search_index.remove_note(db, note.id)
+        blobs.release(db, [note.content_hash])
+        db.delete(note)
+        db.commit()
+
+    await run_db(session, run)
 
 
 @router.put("/{note_id}", response_model=NoteOut)
-def update_note(
+async def update_note(
     note_id: int,
     payload: NoteUpdate,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
-    note = _get_note_for_user(note_id, token, db, must_be_owner=True)
-
-    for field, value in payload.dict(exclude_unset=True, exclude={"tag_names"}).items():
-        setattr(note, field, value)
-
-    # Handle tag changes if provided
-    if payload.tag_names is not None:
-        # 1. remove existing
-        db.query(NoteTag).filter(NoteTag.note_id == note.id).delete()
-        # 2. add new
-        for t in payload.tag_names:
-            tag = db.query(Tag).filter(func.lower(
-                Tag.tag_name) == t.lower()).first()
-            if not tag:
-                tag = Tag(tag_name=t.lower())
-                db.add(tag)
-                db.flush()
-            db.add(NoteTag(note_id=note.id, tag_id=tag.id))
-
-    db.commit()
-    db.refresh(note)
-    note.tag_names = [t.tag_name for t in note.tags]
-    return note
+    def run(db: Session):
+        # Locked: concurrent edits are recorded one after the other
+        note = _get_note_for_user(note_id, user.id, db, must_be_owner=True,
+                                  for_update=True)
+        before = (note.title, blobs.content_of(note))
+
+        values = payload.dict(exclude_unset=True, exclude={"tag_names"})
+        content = values.pop("content", before[1])
+        for field, value in values.items():
+            setattr(note, field, value)
+        note.version = Note.version + 1
+        if content != before[1]:
+            blobs.set_content(db, note, content)
+        revisions.record(db, note.id, before, (note.title, content))
+
+        # Handle tag changes if provided
+        if payload.tag_names is not None:
+            set_note_tags(db, user.id, note.id, payload.tag_names,
+                          current=[t.id for t in note.tags])
+            db.expire(note, ["tags"])
+
+        reindex_later(db, [note.id])
+        facets.touch(db, user.id)
+        db.commit()
+        note = (
+            db.query(Note)
+            .options(*_note_out_options())
+            .populate_existing()
+            .filter(Note.id == note_id)
+            .one()
+        )
+        return _note_out(note)
+
+    return await run_db(session, run)
+
+
+def _search_query(query, user_id: int, terms: Optional[str], tag: Optional[str]):
+    """`query` (over notes) restricted to the notes readable by `user_id`
+    matching `terms` and `tag`, with the keys they are sorted on
+    (descending)."""
+    query = query.filter(Note.id.in_(access.readable_note_ids(user_id)))
+
+    if has_terms(terms):
+        fts = search_index.match(terms)
+        query = query.join(fts, fts.c.note_id == Note.id)
+        keys = (fts.c.score, Note.id)
+    else:
+        keys = (Note.updated_at, Note.id)
+
+    if tag:
+        query = query.join(NoteTag).join(Tag).filter(
+            Tag.tag_name == normalize_tag(tag))
+
+    return query, keys
 
 
-@router.get("/search", response_model=List[NoteOut])
-def search_notes(
-    title: Optional[str] = None,
+@router.get("/search", response_model=Union[Page[NoteOut], CursorPage[NoteOut]])
+async def search_notes(
+    q: Optional[str] = None,
+    title: Optional[str] = Query(None, deprecated=True),
     tag: Optional[str] = None,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=100),
+    pagination: PaginationMode = "page",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
 ):
-    payload = decode_access_token(token)
-    user_id: int = int(payload.get("user_id"))
-
-    q = db.query(Note).options(selectinload(Note.tags))
-
-    q = q.filter(
-        or_(
-            Note.user_id == user_id,
-            Note.is_public.is_(True),
-            Note.id.in_(
-                db.query(SharedNote.note_id).filter(
-                    SharedNote.shared_with_user_id == user_id
-                )
-            ),
-        )
-    )
+    """
+    Full-text search over title, content and tags of the notes readable by
+    the current user, best matches first. `title` is kept as an alias of `q`.
+    In cursor mode, pages are keyed on (score, id) for a text query and on
+    (updated_at, id) otherwise. `fields` narrows the items as for `GET /`.
+    """
+    user_id = user.id
+    fields = _parse_fields(fields, NOTE_FIELDS, NOTE_OUT_FIELDS)
 
-    if title:
-        q = q.filter(Note.title.ilike(f"%{title}%"))
+    def run(db: Session):
+        query, keys = _search_query(db.query(*_note_columns(fields)), user_id,
+                                    q or title, tag)
 
-    if tag:
-        q = q.join(NoteTag).join(Tag).filter(
-            func.lower(Tag.tag_name) == tag.lower())
+        def transform(rows):
+            return _note_rows_out(db, rows, user_id, fields)
+
+        return _paginate_notes(query, keys, pagination, page, size, cursor,
+                               transform)
+
+    return _page_response(await run_db(session, run))
 
-    notes = q.all()
 
-    for n in notes:
-        n.tag_names = [t.tag_name for t in n.tags]
+@router.get("/search/stream")
+async def stream_search_notes(
+    q: Optional[str] = None,
+    tag: Optional[str] = None,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Every search result as NDJSON (`application/x-ndjson`), best first."""
+    user_id = user.id
+
+    def build_query(db: Session):
+        query, keys = _search_query(
+            db.query(Note).options(*_note_out_options()), user_id, q, tag)
+        return query.order_by(*(k.desc() for k in keys))
 
-    return notes
+    return _stream_ndjson(build_query, lambda n: _note_out(n, n.user_id == user_id))
 
 
 @router.post("/share", response_model=ShareNoteResponse)
-def share_note(
+async def share_note(
     data: ShareNoteRequest,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
     """Share a note with another user (read-only access)"""
-    payload = decode_access_token(token)
-    user_id = int(payload.get("user_id"))
+    user_id = user.id
+
+    def run(db: Session):
+        # Check if note exists and belongs to user
+        note = _get_owned_note(data.note_id, user_id, db)
+
+        # Find user to share with, whether the note is already shared with
+        # them and whether it is shared at all, in one round trip
+        shares = select(SharedNote.id).where(SharedNote.note_id == note.id)
+        recipient = db.execute(
+            select(
+                User.id,
+                exists(shares.where(SharedNote.shared_with_user_id == User.id)),
+                exists(shares),
+            ).where(User.email == data.shared_with_user_email)
+        ).first()
+
+        if not recipient:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        shared_with_user_id, already_shared, has_shares = recipient
 
-    # Check if note exists and belongs to user
-    note = db.query(Note).filter(
-        Note.id == data.note_id,
-        Note.user_id == user_id
-    ).first()
+        if already_shared:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Note already shared with this user"
+            )
 
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found or you don't have permission"
+        facets.move_notes(
+            db, user_id,
+            facets.visibility(note.is_public, has_shares),
+            facets.visibility(note.is_public, True),
         )
 
-    # Find user to share with
-    shared_with_user = db.query(User).filter(
-        User.email == data.shared_with_user_email
-    ).first()
-
-    if not shared_with_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+        # Create share record
+        shared_note = SharedNote(
+            note_id=data.note_id,
+            shared_by_user_id=user_id,
+            shared_with_user_id=shared_with_user_id
         )
 
-    # Check if already shared
-    existing_share = db.query(SharedNote).filter(
-        SharedNote.note_id == data.note_id,
-        SharedNote.shared_with_user_id == shared_with_user.id
-    ).first()
-
-    if existing_share:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Note already shared with this user"
-        )
-
-    # Create share record
-    shared_note = SharedNote(
-        note_id=data.note_id,
-        shared_by_user_id=user_id,
-        shared_with_user_id=shared_with_user.id
-    )
+        db.add(shared_note)
+        _bump_versions(db, [note.id])
+        db.commit()
+        db.refresh(shared_note)
+        forget_user(shared_note.shared_with_user_id)
 
-    db.add(shared_note)
-    db.commit()
-    db.refresh(shared_note)
+        return shared_note
 
-    return shared_note
+    return await run_db(session, run)
 
 
 @router.post("/public-link", response_model=PublicLinkResponse)
-def create_public_link(
+async def create_public_link(
     data: PublicLinkRequest,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
     """Generate a public link for a note"""
-    payload = decode_access_token(token)
-    user_id = int(payload.get("user_id"))
+    user_id = user.id
+
+    def run(db: Session):
+        # Check if note exists and belongs to user
+        note = _get_owned_note(data.note_id, user_id, db)
+
+        # Generate token if doesn't exist
+        if not note.public_token:
+            facets.move_notes(
+                db, user_id,
+                facets.visibility(note.is_public, facets.has_shares(db, note.id)),
+                "public",
+            )
+            note.public_token = secrets.token_urlsafe(32)
+            note.is_public = True
+            note.version = Note.version + 1
+            db.commit()
+            db.refresh(note)
 
-    # Check if note exists and belongs to user
-    note = db.query(Note).filter(
-        Note.id == data.note_id,
-        Note.user_id == user_id
-    ).first()
+        public_url = f"https://127.0.0.1/public/notes/{note.public_token}"
 
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found or you don't have permission"
+        return PublicLinkResponse(
+            public_url=public_url,
+            token=note.public_token
         )
 
-    # Generate token if doesn't exist
-    if not note.public_token:
-        note.public_token = secrets.token_urlsafe(32)
-        note.is_public = True
-        db.commit()
-        db.refresh(note)
+    return await run_db(session, run)
 
-    public_url = f"https://127.0.0.1/public/notes/{note.public_token}"
 
-    return PublicLinkResponse(
-        public_url=public_url,
-        token=note.public_token
+def _shared_note_out(note: Note, shared_at) -> SharedNoteOut:
+    return SharedNoteOut(
+        id=note.id,
+        title=note.title,
+        content=blobs.content_of(note),
+        owner_name=f"{note.owner.first_name} {note.owner.last_name}",
+        shared_at=shared_at,
     )
 
 
-@router.get("/shared", response_model=List[SharedNoteOut])
-def get_shared_notes(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
-):
-    """Get notes shared with the current user"""
-    payload = decode_access_token(token)
-    user_id = int(payload.get("user_id"))
-
-    # Get notes shared with current user
-    shared_notes = db.query(Note).join(SharedNote).filter(
-        SharedNote.shared_with_user_id == user_id
-    ).all()
-
-    result = []
-    for note in shared_notes:
-        shared_note_data = SharedNoteOut(
-            id=note.id,
-            title=note.title,
-            content=note.content,
-            owner_name=f"{note.owner.first_name} {note.owner.last_name}",
-            shared_at=note.shared_entries[0].shared_at,  # Get first share date
-            tags=note.tags
+_SHARED_COLUMNS = {
+    "id": Note.id,
+    "title": Note.title,
+    "content": Note.content,
+    "content_hash": Note.content_hash,
+    "snippet": _NOTE_COLUMNS["snippet"],
+    "first_name": User.first_name,
+    "last_name": User.last_name,
+    "shared_at": SharedNote.shared_at,
+}
+# Fields a shared notes listing can be narrowed to with `fields=`
+SHARED_FIELDS = {
+    "id": ("id",),
+    "title": ("title",),
+    "content": ("content", "content_hash"),
+    "snippet": ("snippet",),
+    "owner_name": ("first_name", "last_name"),
+    "shared_at": ("shared_at",),
+}
+SHARED_OUT_FIELDS = tuple(f for f in SHARED_FIELDS if f != "snippet")
+
+
+def _shared_rows_query(db: Session, user_id: int,
+                       fields: tuple = SHARED_OUT_FIELDS):
+    """The columns of `fields` (SharedNoteOut by default) of the notes
+    shared with `user_id`, as rows. The owner is only joined for
+    `owner_name`."""
+    names = _column_names(_SHARED_COLUMNS, SHARED_FIELDS, fields)
+    query = (
+        db.query(*(_SHARED_COLUMNS[name] for name in names))
+        .select_from(Note)
+        .join(SharedNote, SharedNote.note_id == Note.id)
+        .filter(SharedNote.shared_with_user_id == user_id)
+    )
+    if "owner_name" in fields:
+        query = query.join(User, User.id == Note.user_id)
+    return query
+
+
+def _shared_rows_out(db: Session, rows, fields: tuple = SHARED_OUT_FIELDS) -> List[dict]:
+    """SharedNoteOut documents, or their `fields`, for rows of
+    `_shared_rows_query`, with one query for the bodies stored as blobs."""
+    names = _column_names(_SHARED_COLUMNS, SHARED_FIELDS, fields)
+    at = {name: i for i, name in enumerate(names)}
+    # Rows of a single column come back as scalars
+    rows = [row if isinstance(row, (tuple, Row)) else (row,) for row in rows]
+    if "content" in fields:
+        contents = blobs.resolve(
+            db, [(row[at["content"]], row[at["content_hash"]]) for row in rows])
+
+    values = {
+        "id": lambda i, row: row[at["id"]],
+        "title": lambda i, row: row[at["title"]],
+        "content": lambda i, row: contents[i],
+        "snippet": lambda i, row: row[at["snippet"]],
+        "owner_name": lambda i, row: f"{row[at['first_name']]} {row[at['last_name']]}",
+        "shared_at": lambda i, row: row[at["shared_at"]],
+    }
+    getters = [(field, values[field]) for field in fields]
+    return [{field: get(i, row) for field, get in getters}
+            for i, row in enumerate(rows)]
+
+
+def _shared_query(db: Session, user_id: int):
+    """The notes shared with `user_id` as entities, with only the columns
+    `_shared_note_out` reads."""
+    return (
+        db.query(Note, SharedNote.shared_at)
+        .join(SharedNote)
+        .options(
+            load_only(Note.id, Note.title, Note.content, Note.content_hash,
+                      Note.updated_at),
+            joinedload(Note.owner).load_only(User.first_name, User.last_name),
+            selectinload(Note.blob),
         )
-        result.append(shared_note_data)
+        .filter(SharedNote.shared_with_user_id == user_id)
+    )
 
-    return result
 
+@router.get("/shared", response_model=Union[Page[SharedNoteOut], CursorPage[SharedNoteOut]])
+async def get_shared_notes(
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=100),
+    pagination: PaginationMode = "page",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Get notes shared with the current user, most recently updated first.
+    `fields` (e.g. `title,snippet`) narrows the items to these
+    SharedNoteOut fields plus `id`, as for `GET /`.
+    """
+    user_id = user.id
+    fields = _parse_fields(fields, SHARED_FIELDS, SHARED_OUT_FIELDS)
 
-@router.get("/public/{token}")
-def get_public_note(token: str, db: Session = Depends(get_db)):
-    """Access a note via public token (no authentication required)"""
-    note = db.query(Note).filter(
-        Note.public_token == token,
-        Note.is_public == True
-    ).first()
-
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Public note not found or access denied"
-        )
+    def run(db: Session):
+        def transform(rows):
+            return _shared_rows_out(db, rows, fields)
 
-    return {
+        return _paginate_notes(_shared_rows_query(db, user_id, fields),
+                               (Note.updated_at, Note.id),
+                               pagination, page, size, cursor, transform)
+
+    return _page_response(await run_db(session, run))
+
+
+@router.get("/shared/stream")
+async def stream_shared_notes(
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Every note shared with the current user as NDJSON."""
+    user_id = user.id
+
+    def build_query(db: Session):
+        return _shared_query(db, user_id).order_by(
+            Note.updated_at.desc(), Note.id.desc())
+
+    return _stream_ndjson(build_query, lambda row: _shared_note_out(*row))
+
+
+def _render_public_note(note: Note) -> dict:
+    """The cached form of a public note: the JSON body, its validators and
+    the version it was rendered from."""
+    body = json.dumps(jsonable_encoder({
         "id": note.id,
         "title": note.title,
-        "content": note.content,
+        "content": blobs.content_of(note),
         "owner": f"{note.owner.first_name} {note.owner.last_name}",
         "created_at": note.created_at,
-        "tags": note.tags
+        "tags": [TagOut(id=t.id, tag_name=t.tag_name) for t in note.tags],
+    }))
+    return {
+        "version": note.version,
+        "body": body,
+        # Digest of the body rather than of updated_at alone: tag changes do
+        # not bump updated_at, and it only has a one second resolution.
+        "etag": strong_etag(body.encode()),
+        "last_modified": http_date(note.updated_at or note.created_at),
     }
 
 
+@router.get("/public/{token}")
+async def get_public_note(
+    token: str,
+    request: Request,
+    session: AnySession = Depends(get_session),
+):
+    """
+    Access a note via public token (no authentication required).
+
+    Rendered notes are cached (`public_note_cache`); a cached one costs one
+    lookup of the token checking that the note is still public and that its
+    version still matches, so deleted, unpublished and edited notes are
+    seen by every worker.
+    """
+    cached = public_note_cache.get(token)
+
+    def run(db: Session):
+        public = (Note.public_token == token, Note.is_public == True)
+        if cached is not None:
+            version = db.scalar(select(Note.version).where(*public))
+            if version == cached["version"]:
+                return cached
+        note = db.query(Note).options(
+            joinedload(Note.owner),
+            selectinload(Note.tags),
+            selectinload(Note.blob),
+        ).filter(*public).first()
+
+        if not note:
+            public_note_cache.delete(token)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Public note not found or access denied"
+            )
+
+        rendered = _render_public_note(note)
+        public_note_cache.set(token, rendered)
+        return rendered
+
+    rendered = await run_db(session, run)
+    headers = {
+        "ETag": rendered["etag"],
+        "Last-Modified": rendered["last_modified"],
+        "Cache-Control": "public, no-cache",
+    }
+    if is_not_modified(request, rendered["etag"], rendered["last_modified"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(rendered["body"], media_type="application/json", headers=headers)
+
+
 @router.delete("/share/{share_id}")
-def unshare_note(
+async def unshare_note(
     share_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
     """Remove sharing access for a note"""
-    payload = decode_access_token(token)
-    user_id = int(payload.get("user_id"))
-
-    # Find the share record
-    shared_note = db.query(SharedNote).filter(
-        SharedNote.id == share_id,
-        SharedNote.shared_by_user_id == user_id
-    ).first()
+    user_id = user.id
+
+    def run(db: Session):
+        # Find the share record
+        shared_note = db.query(SharedNote).filter(
+            SharedNote.id == share_id,
+            SharedNote.shared_by_user_id == user_id
+        ).first()
+
+        if not shared_note:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Share record not found or you don't have permission"
+            )
 
-    if not shared_note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Share record not found or you don't have permission"
-        )
+        note = db.get(Note, shared_note.note_id)
+        db.delete(shared_note)
+        db.flush()
+        if not note.is_public and not facets.has_shares(db, note.id):
+            facets.move_notes(db, note.user_id, "shared", "private")
+        else:
+            facets.touch(db, note.user_id)
+        _bump_versions(db, [note.id])
+        db.commit()
+        forget_user(shared_note.shared_with_user_id)
 
-    db.delete(shared_note)
-    db.commit()
+        return {"message": "Note unshared successfully"}
 
-    return {"message": "Note unshared successfully"}
+    return await run_db(session, run)
 
 
 @router.delete("/public-link/{note_id}")
-def remove_public_link(
+async def remove_public_link(
     note_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
 ):
     """Remove public access for a note"""
-    payload = decode_access_token(token)
-    user_id = int(payload.get("user_id"))
+    user_id = user.id
 
-    note = db.query(Note).filter(
-        Note.id == note_id,
-        Note.user_id == user_id
-    ).first()
+    def run(db: Session):
+        note = _get_owned_note(note_id, user_id, db)
+
+        if note.is_public:
+            facets.move_notes(
+                db, user_id, "public",
+                facets.visibility(False, facets.has_shares(db, note.id)),
+            )
+        elif note.public_token:
+            facets.touch(db, user_id)
+        if note.is_public or note.public_token:
+            note.version = Note.version + 1
+        note.public_token = None
+        note.is_public = False
+        db.commit()
+
+        return {"message": "Public access removed successfully"}
+
+    return await run_db(session, run)
+
+
+def _note_document_options():
+    """Everything `_note_out` reads, joined into the query of the note."""
+    return (
+        joinedload(Note.tags).load_only(Tag.tag_name),
+        joinedload(Note.shared_entries).joinedload(SharedNote.shared_with_user),
+        joinedload(Note.blob),
+    )
 
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found or you don't have permission"
-        )
 
-    note.public_token = None
-    note.is_public = False
-    db.commit()
+def _render_note(note: Note, is_owner: bool) -> dict:
+    """The cached form of a note: the JSON body, its ETag and the version
+    it was rendered from."""
+    body = _note_out(note, is_owner).model_dump_json()
+    return {
+        "version": note.version,
+        "body": body,
+        "etag": strong_etag(body.encode()),
+    }
+
 
-    return {"message": "Public access removed successfully"}
+def _note_cache_key(note_id: int, is_owner: bool) -> str:
+    return f"{note_id}:{'owner' if is_owner else 'reader'}"
+
+
+# Registered after every static GET path, which /{note_id} would shadow
+@router.get("/{note_id}", response_model=NoteOut)
+async def get_note(
+    note_id: int,
+    request: Request,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    A note readable by the current user (owned, shared with them or public)
+    with its full content and tags, read in one query. Its shares and
+    public link are only returned to its owner.
+
+    Rendered notes are cached (`note_cache`), the owner's and the readers'
+    apart; a cached one costs the query checking access and its version.
+    Responses carry an ETag and a matching If-None-Match gets a 304.
+    """
+    user_id = user.id
+
+    def run(db: Session):
+        cached = {
+            is_owner: note_cache.get(_note_cache_key(note_id, is_owner))
+            for is_owner in (True, False)
+        }
+        if any(cached.values()):
+            note = _get_note_for_user(
+                note_id, user_id, db,
+                options=(load_only(Note.user_id, Note.is_public, Note.version),),
+            )
+            entry = cached[note.user_id == user_id]
+            if entry is not None and entry["version"] == note.version:
+                return entry
+            db.expunge(note)
+        note = _get_note_for_user(note_id, user_id, db,
+                                  options=_note_document_options())
+        is_owner = note.user_id == user_id
+        rendered = _render_note(note, is_owner)
+        note_cache.set(_note_cache_key(note_id, is_owner), rendered)
+        return rendered
+
+    rendered = await run_db(session, run)
+    headers = {"ETag": rendered["etag"], "Cache-Control": "private, no-cache"}
+    if is_not_modified(request, rendered["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(rendered["body"], media_type="application/json", headers=headers)
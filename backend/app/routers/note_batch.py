@@ -0,0 +1,273 @@
+# app/routers/note_batch.py
+"""
+Bulk variants of the note endpoints.
+
+Every request runs in one transaction with a fixed number of statements
+(bulk INSERT ... RETURNING, executemany UPDATE / DELETE) whatever the
+number of items. Items the user may not touch are reported in the per-item
+results and skipped; the others are applied.
+"""
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app import access, blobs, facets, revisions
+from app.config.db import AnySession, get_session, run_db
+from app.helper import get_current_user
+from app.models.note import Note, NoteTag, SharedNote
+from app.routers.note import _bump_versions
+from app.schemaes.auth import CurrentUser
+from app.schemaes.note import (
+    BatchItemResult,
+    BatchResult,
+    NoteBatchCreate,
+    NoteBatchDelete,
+    NoteBatchRetag,
+    NoteBatchUpdate,
+)
+from app.search import reindex_later, search_index
+from app.tags import retag_many, set_tags_many
+
+router = APIRouter(prefix="/notes/batch",
+                   tags=["notes"])
+
+
+def _check_owner(
+    db: Session, user_id: int, ids: Iterable[int]
+) -> Tuple[List[Optional[str]], List[int]]:
+    """
+    One SELECT for the ownership of every id. Returns the per-id error
+    status (None when the user owns the note) and the ids of the owned
+    notes.
+    """
+    ids = list(ids)
+    rows = db.execute(
+        select(Note.id, Note.user_id).where(Note.id.in_(set(ids)))
+    ).all()
+    owners = {r.id: r.user_id for r in rows}
+    statuses = [
+        access.NOT_FOUND if i not in owners
+        else access.FORBIDDEN if owners[i] != user_id
+        else None
+        for i in ids
+    ]
+    return statuses, [r.id for r in rows if r.user_id == user_id]
+
+
+def _forget_facets(db: Session, user_id: int, note_ids: Iterable[int]) -> None:
+    """Takes notes about to be deleted out of the user's facet counts."""
+    note_ids = list(note_ids)
+    has_shares = exists().where(SharedNote.note_id == Note.id)
+    moved = Counter(
+        facets.visibility(is_public, shared)
+        for is_public, shared in db.execute(
+            select(Note.is_public, has_shares).where(Note.id.in_(note_ids))
+        )
+    )
+    for old, count in moved.items():
+        facets.move_notes(db, user_id, old, None, count)
+    facets.queue_tag_counts(db, user_id, {
+        tag_id: -count
+        for tag_id, count in db.execute(
+            select(NoteTag.tag_id, func.count())
+            .where(NoteTag.note_id.in_(note_ids))
+            .group_by(NoteTag.tag_id)
+        )
+    })
+
+
+def insert_notes(db: Session, user_id: int, notes: List[dict]) -> List[int]:
+    """
+    Inserts notes given as dicts with `title`, `content`, `tag_names` and
+    optionally `created_at` / `updated_at`, with their tags, and queues
+    their search entries. Returns the new ids in the order of `notes`.
+    Does not commit.
+    """
+    if not notes:
+        return []
+    contents = blobs.store_many(db, [n.get("content") for n in notes])
+    # One multi-row INSERT ... RETURNING. Ids are allocated in VALUES
+    # order (SQLite rowids, Postgres sequences), so the sorted ids line
+    # up with the notes. sort_by_parameter_order would do the same but
+    # degrades to one INSERT per row on SQLite.
+    note_ids = sorted(db.scalars(
+        insert(Note).returning(Note.id),
+        [
+            {
+                "user_id": user_id,
+                "title": n["title"],
+                "content": content,
+                "content_hash": content_hash,
+                **{k: n[k] for k in ("created_at", "updated_at") if n.get(k)},
+            }
+            for n, (content, content_hash) in zip(notes, contents)
+        ],
+    ))
+    facets.move_notes(db, user_id, None, "private", len(note_ids))
+    set_tags_many(
+        db,
+        user_id,
+        {i: n.get("tag_names") or () for i, n in zip(note_ids, notes)},
+        current={},
+    )
+    reindex_later(db, note_ids)
+    return note_ids
+
+
+def _results(ids: List[int], statuses: List[Optional[str]], done: str) -> BatchResult:
+    return BatchResult(results=[
+        BatchItemResult(index=i, id=note_id, status=status or done)
+        for i, (note_id, status) in enumerate(zip(ids, statuses))
+    ])
+
+
+@router.post("/create", response_model=BatchResult)
+async def batch_create_notes(
+    data: NoteBatchCreate,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Create many notes; results are in the order of `items`."""
+    user_id = user.id
+
+    def run(db: Session):
+        note_ids = insert_notes(db, user_id, [item.model_dump() for item in data.items])
+        db.commit()
+        return _results(note_ids, [None] * len(note_ids), "created")
+
+    return await run_db(session, run)
+
+
+@router.post("/update", response_model=BatchResult)
+async def batch_update_notes(
+    data: NoteBatchUpdate,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Update many notes. Only the fields present in an item are changed;
+    `tag_names` replaces the note's tags.
+    """
+    user_id = user.id
+
+    def run(db: Session):
+        ids = [item.id for item in data.items]
+        statuses, _ = _check_owner(db, user_id, ids)
+        items = [item for item, s in zip(data.items, statuses) if s is None]
+
+        rows = {}
+        for item in items:
+            values = item.model_dump(exclude_unset=True, include={"title", "content"})
+            if values.get("title", "") is None:
+                del values["title"]
+            if values:
+                # The same note may be updated more than once in a batch
+                rows.setdefault(item.id, {"id": item.id}).update(values)
+        if rows:
+            _update_notes(db, list(rows.values()))
+
+        retagged = {i.id: i.tag_names for i in items if i.tag_names is not None}
+        set_tags_many(db, user_id, retagged)
+
+        reindex_later(db, {item.id for item in items})
+        if items:
+            _bump_versions(db, {item.id for item in items})
+            facets.touch(db, user_id)
+        db.commit()
+        return _results(ids, statuses, "updated")
+
+    return await run_db(session, run)
+
+
+def _update_notes(db: Session, rows: List[dict]) -> None:
+    """
+    Applies the UPDATE rows (id + changed fields, one per note) with their
+    revisions, storing the new contents (app.blobs) and releasing the blobs
+    of the replaced ones.
+    """
+    # Locked in id order, so that concurrent batches cannot deadlock
+    current = db.execute(
+        select(Note.id, Note.title, Note.content, Note.content_hash)
+        .where(Note.id.in_([row["id"] for row in rows]))
+        .order_by(Note.id)
+        .with_for_update()
+    ).all()
+    stored = {note_id: (content, content_hash)
+              for note_id, _, content, content_hash in current}
+    versions = {
+        note_id: (title, content)
+        for (note_id, title, _, _), content
+        in zip(current, blobs.resolve(db, list(stored.values())))
+    }
+
+    edits, replaced = {}, []
+    for row in rows:
+        before = versions[row["id"]]
+        after = (row.get("title", before[0]), row.get("content", before[1]))
+        edits[row["id"]] = (before, after)
+        if "content" not in row:
+            continue
+        if after[1] == before[1]:
+            row["content"], row["content_hash"] = stored[row["id"]]
+        else:
+            replaced.append(row)
+    revisions.record_many(db, edits)
+
+    for row, (content, content_hash) in zip(
+        replaced, blobs.store_many(db, [row["content"] for row in replaced])
+    ):
+        row["content"], row["content_hash"] = content, content_hash
+    blobs.release(db, [stored[row["id"]][1] for row in replaced])
+    db.execute(update(Note), rows)
+
+
+@router.post("/delete", response_model=BatchResult)
+async def batch_delete_notes(
+    data: NoteBatchDelete,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Delete many notes; their tags links and shares go with them."""
+    user_id = user.id
+
+    def run(db: Session):
+        statuses, owned = _check_owner(db, user_id, data.ids)
+        if owned:
+            _forget_facets(db, user_id, owned)
+            search_index.remove_many(db, owned)
+            # notetags / sharednotes rows are removed by ON DELETE CASCADE
+            blobs.release(db, db.scalars(
+                delete(Note)
+                .where(Note.id.in_(list(owned)))
+                .returning(Note.content_hash)
+                .execution_options(synchronize_session=False)
+            ).all())
+        db.commit()
+        return _results(data.ids, statuses, "deleted")
+
+    return await run_db(session, run)
+
+
+@router.post("/tags", response_model=BatchResult)
+async def batch_retag_notes(
+    data: NoteBatchRetag,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Add the `add` tags to and remove the `remove` tags from many notes."""
+    user_id = user.id
+
+    def run(db: Session):
+        statuses, owned = _check_owner(db, user_id, data.ids)
+        if owned:
+            retag_many(db, user_id, owned, add=data.add, remove=data.remove)
+            _bump_versions(db, owned)
+            reindex_later(db, owned)
+            facets.touch(db, user_id)
+        db.commit()
+        return _results(data.ids, statuses, "updated")
+
+    return await run_db(session, run)
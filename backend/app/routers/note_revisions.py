@@ -0,0 +1,95 @@
+# app/routers/note_revisions.py
+"""
+History of a note (see app.revisions), visible to its owner only.
+"""
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app import blobs, facets, revisions
+from app.config.db import AnySession, get_session, run_db
+from app.helper import get_current_user
+from app.models.note import Note
+from app.routers.note import _get_owned_note, _note_out, _note_out_options
+from app.schemaes.auth import CurrentUser
+from app.schemaes.note import NoteOut, NoteVersion, RevisionOut
+from app.search import reindex_later
+
+router = APIRouter(prefix="/notes",
+                   tags=["notes"])
+
+REVISION_NOT_FOUND = "Revision not found"
+
+
+@router.get("/{note_id}/revisions", response_model=List[RevisionOut])
+async def list_revisions(
+    note_id: int,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Revisions of a note, newest first. Notes that were never edited have none."""
+    def run(db: Session):
+        _get_owned_note(note_id, user.id, db)
+        return revisions.list_revisions(db, note_id)
+
+    return await run_db(session, run)
+
+
+@router.get("/{note_id}/revisions/{number}", response_model=NoteVersion)
+async def get_revision(
+    note_id: int,
+    number: int,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Title and content of a note as of revision `number`."""
+    def run(db: Session):
+        _get_owned_note(note_id, user.id, db)
+        version = revisions.get_version(db, note_id, number)
+        if version is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=REVISION_NOT_FOUND)
+        return version
+
+    return await run_db(session, run)
+
+
+@router.post("/{note_id}/revisions/{number}/restore", response_model=NoteOut)
+async def restore_revision(
+    note_id: int,
+    number: int,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Sets the title and content of a note back to revision `number`. The
+    restore is itself recorded as a new revision.
+    """
+    def run(db: Session):
+        note = _get_owned_note(note_id, user.id, db, for_update=True)
+        version = revisions.get_version(db, note_id, number)
+        if version is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=REVISION_NOT_FOUND)
+
+        before = (note.title, blobs.content_of(note))
+        note.title = version["title"]
+        note.version = Note.version + 1
+        if version["content"] != before[1]:
+            blobs.set_content(db, note, version["content"])
+        revisions.record(db, note.id, before, (note.title, version["content"]))
+
+        reindex_later(db, [note.id])
+        facets.touch(db, user.id)
+        db.commit()
+        note = (
+            db.query(Note)
+            .options(*_note_out_options())
+            .populate_existing()
+            .filter(Note.id == note_id)
+            .one()
+        )
+        return _note_out(note)
+
+    return await run_db(session, run)
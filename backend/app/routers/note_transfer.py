@@ -0,0 +1,219 @@
+# app/routers/note_transfer.py
+"""
+Export and import of all of a user's notes.
+
+Both directions stream: the export reads the notes through a server-side
+cursor (`yield_per`) and the import parses the upload line by line and
+commits every `IMPORT_CHUNK_SIZE` notes, so memory does not grow with the
+size of the account.
+"""
+import json
+import re
+import zipfile
+from typing import List, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app import blobs
+from app.config.db import AnySession, SessionLocal, get_session, run_db
+from app.helper import get_current_user
+from app.models.note import Note
+from app.routers.note import STREAM_BATCH_SIZE, _note_out_options, _stream_ndjson
+from app.routers.note_batch import insert_notes
+from app.schemaes.auth import CurrentUser
+from app.schemaes.note import ImportLineError, ImportResult, NoteExport, NoteImport
+
+router = APIRouter(prefix="/notes",
+                   tags=["notes"])
+
+# Notes inserted and committed per transaction by the import
+IMPORT_CHUNK_SIZE = 1000
+# Longest accepted import line; a longer one is rejected with 413
+IMPORT_MAX_LINE_BYTES = 10 * 1024 * 1024
+# Line errors echoed back in the import result (all are counted)
+IMPORT_MAX_ERRORS = 100
+
+_SLUG_RE = re.compile(r"[^\w-]+", re.UNICODE)
+
+
+def _note_export(n: Note) -> NoteExport:
+    return NoteExport(
+        id=n.id,
+        title=n.title,
+        content=blobs.content_of(n),
+        is_public=bool(n.is_public),
+        created_at=n.created_at,
+        updated_at=n.updated_at,
+        tags=[t.tag_name for t in n.tags],
+        shared_with=[s.shared_with_user.email for s in n.shared_entries],
+    )
+
+
+def _markdown_name(n: Note) -> str:
+    slug = _SLUG_RE.sub("-", n.title.lower()).strip("-")[:60]
+    return f"{n.id}-{slug or 'note'}.md"
+
+
+def _markdown(n: Note) -> str:
+    """The note as Markdown with its metadata in a front matter block."""
+    export = _note_export(n)
+    front_matter = [
+        f"title: {json.dumps(export.title, ensure_ascii=False)}",
+        f"tags: {json.dumps(export.tags, ensure_ascii=False)}",
+        f"created_at: {export.created_at.isoformat()}",
+        f"updated_at: {export.updated_at.isoformat()}",
+        f"public: {'true' if export.is_public else 'false'}",
+        f"shared_with: {json.dumps(export.shared_with)}",
+    ]
+    return "---\n" + "\n".join(front_matter) + "\n---\n\n" + (export.content or "") + "\n"
+
+
+class _ZipStream:
+    """Write-only, unseekable file for `zipfile`: every write is buffered
+    until the response drains it."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_markdown_zip(build_query) -> StreamingResponse:
+    """
+    Streams a zip with one Markdown file per note. Each file is written and
+    sent as soon as its note is read; only the zip central directory (a
+    few hundred bytes per note) is held until the end.
+    """
+    def chunks():
+        out = _ZipStream()
+        with SessionLocal() as db, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+            for note in build_query(db).yield_per(STREAM_BATCH_SIZE):
+                info = zipfile.ZipInfo(_markdown_name(note),
+                                       date_time=note.updated_at.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, _markdown(note))
+                yield out.drain()
+        yield out.drain()
+
+    return StreamingResponse(chunks(), media_type="application/zip")
+
+
+@router.get("/export")
+async def export_notes(
+    format: Literal["ndjson", "markdown"] = "ndjson",
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Every note of the current user with its tags and shares, oldest first:
+    one JSON document per line (`ndjson`, the format `/import` reads back)
+    or a zip of Markdown files (`markdown`).
+    """
+    user_id = user.id
+
+    def build_query(db: Session):
+        return (
+            db.query(Note)
+            .options(*_note_out_options())
+            .filter(Note.user_id == user_id)
+            .order_by(Note.id)
+        )
+
+    if format == "markdown":
+        response = _stream_markdown_zip(build_query)
+        filename = "notes.zip"
+    else:
+        response = _stream_ndjson(build_query, _note_export)
+        filename = "notes.ndjson"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@router.post("/import", response_model=ImportResult)
+async def import_notes(
+    request: Request,
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Creates a note for every line of an NDJSON upload (the body of the
+    request, e.g. an `/export`). Notes are committed every
+    `IMPORT_CHUNK_SIZE` lines, so an interrupted import keeps the chunks
+    already committed. Invalid lines are skipped and reported.
+    """
+    user_id = user.id
+    imported = failed = 0
+    errors: List[ImportLineError] = []
+    chunk: List[dict] = []
+
+    def run(db: Session, notes: List[dict]) -> int:
+        insert_notes(db, user_id, notes)
+        db.commit()
+        return len(notes)
+
+    def parse(line_no: int, line: bytes):
+        nonlocal failed
+        if not line.strip():
+            return
+        try:
+            chunk.append(NoteImport.model_validate_json(line).model_dump())
+        except ValidationError as exc:
+            failed += 1
+            if len(errors) < IMPORT_MAX_ERRORS:
+                error = exc.errors()[0]
+                location = ".".join(str(p) for p in error["loc"])
+                errors.append(ImportLineError(
+                    line=line_no,
+                    detail=f"{location}: {error['msg']}" if location else error["msg"],
+                ))
+
+    def too_long(line_no: int) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Line {line_no} is too long",
+        )
+
+    line_no = 0
+    # The pieces received so far of the current line, joined once its
+    # newline arrives: only new data is searched, and a long line spread
+    # over many pieces is copied once
+    parts: List[bytes] = []
+    size = 0
+    async for data in request.stream():
+        start = 0
+        end = data.find(b"\n")
+        while end != -1:
+            if size + end - start > IMPORT_MAX_LINE_BYTES:
+                raise too_long(line_no + 1)
+            parts.append(data[start:end])
+            line_no += 1
+            parse(line_no, b"".join(parts))
+            parts, size = [], 0
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                imported += await run_db(session, run, chunk)
+                chunk = []
+            start = end + 1
+            end = data.find(b"\n", start)
+        if start < len(data):
+            parts.append(data[start:])
+            size += len(data) - start
+            if size > IMPORT_MAX_LINE_BYTES:
+                raise too_long(line_no + 1)
+    if parts:
+        parse(line_no + 1, b"".join(parts))
+    if chunk:
+        imported += await run_db(session, run, chunk)
+
+    return ImportResult(imported=imported, failed=failed, errors=errors)
@@ -0,0 +1,33 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Query
+
+from app import tag_suggest
+from app.config.db import AnySession, get_session, run_db
+from app.helper import get_current_user
+from app.schemaes.auth import CurrentUser
+from app.schemaes.note import TagCount
+from app.tags import normalize_tag
+
+router = APIRouter(
+    prefix="/tags",
+    tags=["tags"],
+)
+
+
+@router.get("/suggest", response_model=List[TagCount])
+async def suggest_tags(
+    prefix: str = "",
+    limit: int = Query(10, ge=1, le=50),
+    session: AnySession = Depends(get_session),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Tags starting with `prefix` among the tags of the notes the current user
+    owns or that are shared with them, most used first.
+    """
+    prefix = normalize_tag(prefix)
+    suggestions = tag_suggest.suggest_cached(user.id, prefix, limit)
+    if suggestions is None:
+        suggestions = await run_db(session, tag_suggest.suggest, user.id, prefix, limit)
+    return suggestions
@@ -11,6 +11,10 @@ class UserBase(BaseModel):
     email: str
     
 
+class CurrentUser(UserBase):
+    id: int
+
+
 class UserAuth(BaseModel):
     email: str
     password : str
@@ -1,8 +1,13 @@
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Any, List, Optional
+from pydantic import AliasChoices, BaseModel, Field
+from typing import Any, Dict, Generic, List, Literal, Optional, TypeVar
 import uuid
 
+T = TypeVar("T")
+
+# Upper bound on the items of one /notes/batch request
+BATCH_MAX_ITEMS = 1000
+
 
 class SharedUser(BaseModel):
     id: int
@@ -76,4 +81,101 @@ class SharedNoteOut(BaseModel):
     # tags: List[TagOut]
     
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class CursorPage(BaseModel, Generic[T]):
+    items: List[T]
+    size: int
+    next_cursor: Optional[str] = None
+
+
+class NoteBatchCreate(BaseModel):
+    items: List[NoteCreate] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class NoteBatchUpdateItem(BaseModel):
+    id: int
+    title: Optional[str] = None
+    content: Optional[str] = None
+    tag_names: Optional[List[str]] = None
+
+
+class NoteBatchUpdate(BaseModel):
+    items: List[NoteBatchUpdateItem] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class NoteBatchDelete(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class NoteBatchRetag(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    add: List[str] = []
+    remove: List[str] = []
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: Literal["created", "updated", "deleted", "not_found", "forbidden"]
+
+
+class BatchResult(BaseModel):
+    results: List[BatchItemResult]
+
+
+class NoteExport(BaseModel):
+    id: int
+    title: str
+    content: Optional[str]
+    is_public: bool
+    created_at: datetime
+    updated_at: datetime
+    tags: List[str]
+    shared_with: List[str] = []
+
+
+class NoteImport(BaseModel):
+    """One line of an import; the lines of an NDJSON export are accepted."""
+    title: str
+    content: Optional[str] = None
+    tag_names: List[str] = Field([], validation_alias=AliasChoices("tags", "tag_names"))
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportLineError]
+
+
+class TagCount(BaseModel):
+    tag_name: str
+    count: int
+
+
+class NoteFacets(BaseModel):
+    total: int
+    visibility: Dict[str, int]
+    tags: List[TagCount]
+
+
+class RevisionOut(BaseModel):
+    number: int
+    is_snapshot: bool
+    size: int  # stored bytes
+    created_at: datetime
+
+
+class NoteVersion(BaseModel):
+    number: int
+    title: str
+    content: Optional[str]
+    created_at: datetime
@@ -0,0 +1,368 @@
+"""
+Full-text search index for notes.
+
+The index lives next to the `notes` table. Writes to notes call
+`reindex_later`, which adds a write-behind job (app.outbox) to their
+transaction: a rolled back request never leaves a stale entry behind, and
+a committed one is indexed within milliseconds, in a batch with the notes
+of concurrent requests. Searches join the index with `notes`, so deleted
+notes never show up, even before their entry is removed. The backend is
+picked from the engine dialect:
+
+  * sqlite     -> FTS5 virtual table ranked with bm25()
+  * postgresql -> tsvector table with a GIN index ranked with ts_rank()
+
+Other dialects fall back to an unranked LIKE scan and can be given a real
+index with `register_backend`.
+
+At startup, `backfill` indexes every note when the index is empty while
+notes exist (a database from before the index). `python -m app.search`
+rebuilds the index at any time.
+"""
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import Float, Integer, and_, column, literal, or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, selectinload
+
+from app import blobs, outbox
+from app.config.db import engine
+from app.models.note import Note, NoteTag, Tag
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# (note_id, title, content, tag names), as indexed by `index_many`
+IndexEntry = Tuple[int, str, Optional[str], Iterable[str]]
+
+
+def _tokens(query: str) -> List[str]:
+    return _TOKEN_RE.findall(query.lower())
+
+
+class SearchBackend:
+    """Base class for full-text backends.
+
+    `match` returns a selectable with two columns, `note_id` and `score`,
+    where a higher score means a better match.
+    """
+
+    def setup(self, bind: Engine) -> None:
+        raise NotImplementedError
+
+    def index_note(self, db: Session, note: Note, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def remove_note(self, db: Session, note_id: int) -> None:
+        raise NotImplementedError
+
+    def index_many(self, db: Session, entries: Iterable[IndexEntry]) -> None:
+        """(Re-)index many notes with a fixed number of statements."""
+        raise NotImplementedError
+
+    def remove_many(self, db: Session, note_ids: Iterable[int]) -> None:
+        raise NotImplementedError
+
+    def clear(self, db: Session) -> None:
+        raise NotImplementedError
+
+    def is_empty(self, db: Session) -> bool:
+        raise NotImplementedError
+
+    def lock(self, db: Session) -> None:
+        """Keeps other transactions from writing the index until this one
+        ends; nothing by default."""
+
+    def match(self, query: str):
+        raise NotImplementedError
+
+    def rebuild(self, db: Session, batch_size: int = 1000) -> int:
+        """Re-index every note. Returns the number of indexed notes."""
+        self.clear(db)
+        count = 0
+        notes = db.scalars(
+            select(Note)
+            .options(selectinload(Note.tags), selectinload(Note.blob))
+            .execution_options(yield_per=batch_size)
+        )
+        for note in notes:
+            self.index_note(db, note, [t.tag_name for t in note.tags])
+            count += 1
+        return count
+
+
+class LikeBackend(SearchBackend):
+    """Fallback without an index: every token must appear in the title or
+    the content. All matches share the same score. Only the preview of a
+    body stored as a blob (app.blobs) is searched."""
+
+    def setup(self, bind: Engine) -> None:
+        pass
+
+    def index_note(self, db: Session, note: Note, tags: Iterable[str]) -> None:
+        pass
+
+    def remove_note(self, db: Session, note_id: int) -> None:
+        pass
+
+    def index_many(self, db: Session, entries: Iterable[IndexEntry]) -> None:
+        pass
+
+    def remove_many(self, db: Session, note_ids: Iterable[int]) -> None:
+        pass
+
+    def clear(self, db: Session) -> None:
+        pass
+
+    def is_empty(self, db: Session) -> bool:
+        # Nothing to fill
+        return False
+
+    def rebuild(self, db: Session, batch_size: int = 1000) -> int:
+        return 0
+
+    def match(self, query: str):
+        conditions = [
+            or_(Note.title.ilike(f"%{t}%"), Note.content.ilike(f"%{t}%"))
+            for t in _tokens(query)
+        ]
+        return (
+            select(Note.id.label("note_id"), literal(0.0).label("score"))
+            .where(and_(*conditions))
+            .subquery("fts")
+        )
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    # bm25() weights for the (title, content, tags) columns
+    WEIGHTS = (10.0, 1.0, 5.0)
+
+    def setup(self, bind: Engine) -> None:
+        with bind.begin() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts "
+                "USING fts5(title, content, tags, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            ))
+
+    def index_note(self, db: Session, note: Note, tags: Iterable[str]) -> None:
+        self.remove_note(db, note.id)
+        db.execute(
+            text(
+                "INSERT INTO notes_fts (rowid, title, content, tags) "
+                "VALUES (:id, :title, :content, :tags)"
+            ),
+            {
+                "id": note.id,
+                "title": note.title,
+                "content": blobs.content_of(note) or "",
+                "tags": " ".join(tags),
+            },
+        )
+
+    def remove_note(self, db: Session, note_id: int) -> None:
+        db.execute(text("DELETE FROM notes_fts WHERE rowid = :id"),
+                   {"id": note_id})
+
+    def index_many(self, db: Session, entries: Iterable[IndexEntry]) -> None:
+        rows = [
+            {"id": note_id, "title": title, "content": content or "",
+             "tags": " ".join(tags)}
+            for note_id, title, content, tags in entries
+        ]
+        if not rows:
+            return
+        self.remove_many(db, [r["id"] for r in rows])
+        db.execute(
+            text(
+                "INSERT INTO notes_fts (rowid, title, content, tags) "
+                "VALUES (:id, :title, :content, :tags)"
+            ),
+            rows,
+        )
+
+    def remove_many(self, db: Session, note_ids: Iterable[int]) -> None:
+        rows = [{"id": note_id} for note_id in note_ids]
+        if rows:
+            db.execute(text("DELETE FROM notes_fts WHERE rowid = :id"), rows)
+
+    def clear(self, db: Session) -> None:
+        db.execute(text("DELETE FROM notes_fts"))
+
+    def is_empty(self, db: Session) -> bool:
+        return db.scalar(text("SELECT rowid FROM notes_fts LIMIT 1")) is None
+
+    def match(self, query: str):
+        # Every token becomes a quoted prefix term, so user input can never
+        # be interpreted as FTS5 query syntax. Terms are implicitly AND-ed.
+        fts_query = " ".join(f'"{t}"*' for t in _tokens(query))
+        weights = ", ".join(str(w) for w in self.WEIGHTS)
+        return (
+            text(
+                f"SELECT rowid AS note_id, -bm25(notes_fts, {weights}) AS score "
+                "FROM notes_fts WHERE notes_fts MATCH :query"
+            )
+            .bindparams(query=fts_query)
+            .columns(column("note_id", Integer), column("score", Float))
+            .subquery("fts")
+        )
+
+
+class PostgresTSVectorBackend(SearchBackend):
+    CONFIG = "simple"
+
+    def setup(self, bind: Engine) -> None:
+        with bind.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS notes_search ("
+                "note_id INTEGER PRIMARY KEY, "
+                "document TSVECTOR NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_notes_search_document "
+                "ON notes_search USING GIN (document)"
+            ))
+
+    UPSERT = text(
+        "INSERT INTO notes_search (note_id, document) VALUES (:id, "
+        "setweight(to_tsvector(CAST(:cfg AS regconfig), :title), 'A') || "
+        "setweight(to_tsvector(CAST(:cfg AS regconfig), :tags), 'B') || "
+        "setweight(to_tsvector(CAST(:cfg AS regconfig), :content), 'C')) "
+        "ON CONFLICT (note_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+
+    def index_note(self, db: Session, note: Note, tags: Iterable[str]) -> None:
+        self.index_many(db, [(note.id, note.title, blobs.content_of(note), tags)])
+
+    def remove_note(self, db: Session, note_id: int) -> None:
+        self.remove_many(db, [note_id])
+
+    def index_many(self, db: Session, entries: Iterable[IndexEntry]) -> None:
+        rows = [
+            {"id": note_id, "cfg": self.CONFIG, "title": title,
+             "content": content or "", "tags": " ".join(tags)}
+            for note_id, title, content, tags in entries
+        ]
+        if rows:
+            db.execute(self.UPSERT, rows)
+
+    def remove_many(self, db: Session, note_ids: Iterable[int]) -> None:
+        note_ids = list(note_ids)
+        if note_ids:
+            db.execute(
+                text("DELETE FROM notes_search WHERE note_id = ANY(:ids)"),
+                {"ids": note_ids},
+            )
+
+    def clear(self, db: Session) -> None:
+        db.execute(text("DELETE FROM notes_search"))
+
+    def is_empty(self, db: Session) -> bool:
+        return db.scalar(text("SELECT note_id FROM notes_search LIMIT 1")) is None
+
+    def lock(self, db: Session) -> None:
+        # Self-conflicting, unlike the locks taken by writes to the index
+        db.execute(text("LOCK TABLE notes_search IN SHARE ROW EXCLUSIVE MODE"))
+
+    def match(self, query: str):
+        ts_query = " & ".join(f"{t}:*" for t in _tokens(query))
+        return (
+            text(
+                "SELECT note_id, ts_rank(document, q) AS score "
+                "FROM notes_search, to_tsquery(CAST(:cfg AS regconfig), :query) q "
+                "WHERE document @@ q"
+            )
+            .bindparams(cfg=self.CONFIG, query=ts_query)
+            .columns(column("note_id", Integer), column("score", Float))
+            .subquery("fts")
+        )
+
+
+_BACKENDS: Dict[str, Type[SearchBackend]] = {
+    "sqlite": SQLiteFTS5Backend,
+    "postgresql": PostgresTSVectorBackend,
+}
+
+
+def register_backend(dialect: str, backend: Type[SearchBackend]) -> None:
+    _BACKENDS[dialect] = backend
+
+
+def get_backend(dialect: str) -> SearchBackend:
+    return _BACKENDS.get(dialect, LikeBackend)()
+
+
+search_index = get_backend(engine.dialect.name)
+
+REINDEX = "search.reindex"
+
+
+def reindex(db: Session, note_ids: Iterable[int]) -> None:
+    """Brings the entries of the notes up to date, removing the ones of
+    deleted notes, with a fixed number of statements."""
+    note_ids = list(note_ids)
+    if not note_ids:
+        return
+    tags = defaultdict(list)
+    for note_id, tag_name in db.execute(
+        select(NoteTag.note_id, Tag.tag_name)
+        .join(Tag, Tag.id == NoteTag.tag_id)
+        .where(NoteTag.note_id.in_(note_ids))
+    ):
+        tags[note_id].append(tag_name)
+    notes = db.execute(
+        select(Note.id, Note.title, Note.content, Note.content_hash)
+        .where(Note.id.in_(note_ids))
+    ).all()
+    contents = blobs.resolve(db, [(n.content, n.content_hash) for n in notes])
+    search_index.index_many(
+        db, [(n.id, n.title, content, tags[n.id])
+             for n, content in zip(notes, contents)]
+    )
+    search_index.remove_many(db, set(note_ids) - {n.id for n in notes})
+
+
+def reindex_later(db: Session, note_ids: Iterable[int]) -> None:
+    """`reindex` once the session's transaction is committed."""
+    note_ids = sorted(set(note_ids))
+    if note_ids:
+        outbox.enqueue(db, REINDEX, {"note_ids": note_ids})
+
+
+@outbox.handler(REINDEX)
+def _run_reindex(db: Session, payloads: List[dict]) -> None:
+    reindex(db, {note_id for p in payloads for note_id in p["note_ids"]})
+
+
+def backfill(db: Session) -> int:
+    """
+    Indexes every note when the index is empty but notes exist, e.g. on
+    the first start after the index was added. Returns the number of
+    indexed notes. Concurrent calls (one per worker process) index the
+    notes once on Postgres, where the index is locked until the caller
+    commits; SQLite serializes them. Does not commit.
+    """
+    search_index.lock(db)
+    if not search_index.is_empty(db) or db.scalar(select(Note.id).limit(1)) is None:
+        return 0
+    indexed = search_index.rebuild(db)
+    logger.info("Indexed %d existing notes for search", indexed)
+    return indexed
+
+
+def has_terms(query: Optional[str]) -> bool:
+    return bool(query and _tokens(query))
+
+
+if __name__ == "__main__":
+    from app.config.db import SessionLocal
+
+    search_index.setup(engine)
+    with SessionLocal() as db:
+        indexed = search_index.rebuild(db)
+        db.commit()
+    print(f"Indexed {indexed} notes")
@@ -0,0 +1,35 @@
+"""
+Production server: gunicorn managing uvicorn workers (see gunicorn.conf.py).
+
+    gunicorn main:app
+
+The app is imported once in the gunicorn master and forked into
+WEB_CONCURRENCY workers. Each worker is a separate process with its own
+connection pool, caches and metrics.
+"""
+import os
+
+from uvicorn_worker import UvicornWorker
+
+from app.config.settings import settings
+
+
+class Worker(UvicornWorker):
+    # Fail at startup rather than silently fall back to asyncio / h11
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+def worker_count() -> int:
+    return settings.WEB_CONCURRENCY or os.cpu_count() or 1
+
+
+def reset_after_fork() -> None:
+    """
+    Drops the connections a worker inherited from the master: a pooled
+    connection must never be used by two processes.
+    """
+    from app.config.db import async_engine, engine
+
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
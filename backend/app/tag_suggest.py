@@ -0,0 +1,142 @@
+"""
+Tag autocomplete.
+
+`TagPrefixIndex` keeps every tag name in a sorted array, so the names
+starting with a prefix are one `bisect` away. It is loaded from the `tags`
+table on first use and extended by `app.tags.resolve_tags` when tags are
+created; a tag created by another worker process is added the first time
+a user who can see it asks for suggestions.
+
+Suggestions are restricted to the tags of the notes a user can see (their
+own notes and the notes shared with them) and ranked by how many of those
+notes carry the tag. These counts are cached per user for
+TAG_SUGGEST_CACHE_TTL_SECONDS and dropped when the user's own tag counts
+change, so a warm suggestion never touches the database.
+"""
+import bisect
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from app.cache import TTLCache
+from app.config.settings import settings
+from app.models.facets import UserTagCount
+from app.models.note import NoteTag, SharedNote, Tag
+
+
+class TagPrefixIndex:
+    def __init__(self):
+        self._names: List[str] = []
+        self._ids: List[int] = []
+        self._by_id: Dict[int, str] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db: Session) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            rows = db.execute(select(Tag.tag_name, Tag.id).order_by(Tag.tag_name)).all()
+            self._names = [name for name, _ in rows]
+            self._ids = [tag_id for _, tag_id in rows]
+            self._by_id = {tag_id: name for name, tag_id in rows}
+            self._loaded = True
+
+    def add_many(self, tags: Iterable[Tuple[str, int]]) -> None:
+        """Adds (name, id) pairs. A no-op until the index is loaded: the load
+        reads them from the table."""
+        if not self._loaded:
+            return
+        with self._lock:
+            for name, tag_id in tags:
+                if tag_id in self._by_id:
+                    continue
+                index = bisect.bisect_left(self._names, name)
+                self._names.insert(index, name)
+                self._ids.insert(index, tag_id)
+                self._by_id[tag_id] = name
+
+    def __contains__(self, tag_id: int) -> bool:
+        return tag_id in self._by_id
+
+    def range_size(self, prefix: str) -> int:
+        start, end = self._bounds(prefix)
+        return end - start
+
+    def with_prefix(self, prefix: str) -> List[int]:
+        """Ids of the tags whose name starts with `prefix`."""
+        with self._lock:
+            start, end = self._bounds(prefix)
+            return self._ids[start:end]
+
+    def _bounds(self, prefix: str) -> Tuple[int, int]:
+        start = bisect.bisect_left(self._names, prefix)
+        # Every name starting with `prefix` sorts before prefix + U+10FFFF
+        end = bisect.bisect_left(self._names, prefix + "\U0010ffff", start)
+        return start, end
+
+
+tag_index = TagPrefixIndex()
+
+# user id -> {tag id: (tag name, number of visible notes with the tag)}
+_visible = TTLCache(settings.TAG_SUGGEST_CACHE_SIZE,
+                    settings.TAG_SUGGEST_CACHE_TTL_SECONDS)
+
+
+def forget_user(user_id: int) -> None:
+    """Drops the cached tag counts of the user; called when they change."""
+    _visible.pop(user_id)
+
+
+def _load_visible(db: Session, user_id: int) -> Dict[int, Tuple[str, int]]:
+    own = select(UserTagCount.tag_id, UserTagCount.count).where(
+        UserTagCount.user_id == user_id, UserTagCount.count > 0)
+    shared = (
+        select(NoteTag.tag_id, func.count())
+        .join(SharedNote, SharedNote.note_id == NoteTag.note_id)
+        .where(SharedNote.shared_with_user_id == user_id)
+        .group_by(NoteTag.tag_id)
+    )
+    counts = union_all(own, shared).subquery()
+    rows = db.execute(
+        select(Tag.id, Tag.tag_name, func.sum(counts.c.count))
+        .join(counts, counts.c.tag_id == Tag.id)
+        .group_by(Tag.id, Tag.tag_name)
+    ).all()
+    tag_index.add_many((name, tag_id) for tag_id, name, _ in rows if tag_id not in tag_index)
+    visible = {tag_id: (name, int(count)) for tag_id, name, count in rows}
+    _visible.set(user_id, visible)
+    return visible
+
+
+def _rank(visible: Dict[int, Tuple[str, int]], prefix: str, limit: int) -> List[dict]:
+    # Walk whichever is smaller: the prefix range or the user's tags
+    if tag_index.range_size(prefix) <= len(visible):
+        candidates = (visible[t] for t in tag_index.with_prefix(prefix) if t in visible)
+    else:
+        candidates = (v for v in visible.values() if v[0].startswith(prefix))
+    best = heapq.nsmallest(limit, candidates, key=lambda v: (-v[1], v[0]))
+    return [{"tag_name": name, "count": count} for name, count in best]
+
+
+def suggest_cached(user_id: int, prefix: str, limit: int) -> Optional[List[dict]]:
+    """Suggestions from memory only, or None when something must be loaded."""
+    visible = _visible.get(user_id)
+    if visible is None or not tag_index.loaded:
+        return None
+    return _rank(visible, prefix, limit)
+
+
+def suggest(db: Session, user_id: int, prefix: str, limit: int) -> List[dict]:
+    tag_index.load(db)
+    visible = _visible.get(user_id)
+    if visible is None:
+        visible = _load_visible(db, user_id)
+    return _rank(visible, prefix, limit)
@@ -0,0 +1,207 @@
+"""
+Tag bookkeeping shared by the note endpoints.
+
+Tag names are stored normalized (see `normalize_tag`), so every lookup is a
+plain equality / IN on the unique index of `tags.tag_name`. The functions
+changing NoteTag rows also queue the matching change of the per-user tag
+counts of `app.facets`; `user_id` is the owner of the notes.
+"""
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.orm import Session
+
+from app import facets
+from app.tag_suggest import tag_index
+from app.config.db import upsert_insert
+from app.models.note import NoteTag, Tag
+
+
+def normalize_tag(name: str) -> str:
+    return name.strip().lower()
+
+
+def normalize_tags(names: Iterable[str]) -> List[str]:
+    """Normalized, de-duplicated tag names in their original order."""
+    return list(dict.fromkeys(
+        normalize_tag(n) for n in names if n and n.strip()
+    ))
+
+
+def _insert_ignore(db: Session, model):
+    """INSERT ... ON CONFLICT DO NOTHING for the current dialect."""
+    stmt = upsert_insert(db, model)
+    if stmt is None:
+        return insert(model)
+    return stmt.on_conflict_do_nothing()
+
+
+def resolve_tags(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """
+    Maps every tag name to its id, creating the missing tags.
+
+    One SELECT ... IN for the existing tags, then one bulk insert and one
+    SELECT for the missing ones, whatever the number of tags.
+    """
+    names = normalize_tags(names)
+    if not names:
+        return {}
+
+    ids = dict(db.execute(
+        select(Tag.tag_name, Tag.id).where(Tag.tag_name.in_(names))
+    ).all())
+    missing = [n for n in names if n not in ids]
+    if missing:
+        db.execute(_insert_ignore(db, Tag), [{"tag_name": n} for n in missing])
+        created = db.execute(
+            select(Tag.tag_name, Tag.id).where(Tag.tag_name.in_(missing))
+        ).all()
+        ids.update(created)
+        tag_index.add_many(created)
+    return {n: ids[n] for n in names}
+
+
+def set_note_tags(
+    db: Session,
+    user_id: int,
+    note_id: int,
+    names: Iterable[str],
+    *,
+    current: Optional[Iterable[int]] = None,
+) -> List[str]:
+    """
+    Makes `names` the tags of the note, only inserting and deleting the
+    NoteTag rows that changed. `current` are the note's tag ids when the
+    caller already knows them (an empty tuple for a new note).
+
+    Returns the normalized tag names.
+    """
+    wanted = resolve_tags(db, names)
+    if current is None:
+        current = db.scalars(
+            select(NoteTag.tag_id).where(NoteTag.note_id == note_id)
+        )
+    current = set(current)
+    wanted_ids = set(wanted.values())
+
+    removed = current - wanted_ids
+    if removed:
+        db.execute(
+            delete(NoteTag).where(
+                NoteTag.note_id == note_id,
+                NoteTag.tag_id.in_(removed),
+            )
+        )
+    added = [tag_id for tag_id in wanted.values() if tag_id not in current]
+    if added:
+        db.execute(
+            insert(NoteTag),
+            [{"note_id": note_id, "tag_id": tag_id} for tag_id in added],
+        )
+    facets.queue_tag_counts(db, user_id, {
+        **{tag_id: -1 for tag_id in removed},
+        **{tag_id: 1 for tag_id in added},
+    })
+    return list(wanted)
+
+
+def set_tags_many(
+    db: Session,
+    user_id: int,
+    names_by_note: Dict[int, Iterable[str]],
+    *,
+    current: Optional[Dict[int, Iterable[int]]] = None,
+) -> Dict[int, List[str]]:
+    """
+    `set_note_tags` for many notes at once: one tag resolution for all the
+    names, one SELECT of the current rows (skipped when `current` is given,
+    e.g. `{}` for new notes), one executemany DELETE and one bulk INSERT.
+
+    Returns the normalized tag names of every note.
+    """
+    names_by_note = {n: normalize_tags(names) for n, names in names_by_note.items()}
+    if not names_by_note:
+        return {}
+    ids = resolve_tags(db, chain.from_iterable(names_by_note.values()))
+
+    current_ids: Dict[int, Set[int]] = defaultdict(set)
+    if current is None:
+        rows = db.execute(
+            select(NoteTag.note_id, NoteTag.tag_id)
+            .where(NoteTag.note_id.in_(list(names_by_note)))
+        )
+    else:
+        rows = ((n, t) for n, tag_ids in current.items() for t in tag_ids)
+    for note_id, tag_id in rows:
+        current_ids[note_id].add(tag_id)
+
+    removed, added = [], []
+    deltas = Counter()
+    for note_id, names in names_by_note.items():
+        wanted_ids = {ids[n] for n in names}
+        existing = current_ids[note_id]
+        removed.extend(
+            {"b_note_id": note_id, "b_tag_id": t} for t in existing - wanted_ids
+        )
+        added.extend(
+            {"note_id": note_id, "tag_id": ids[n]}
+            for n in names if ids[n] not in existing
+        )
+    for row in removed:
+        deltas[row["b_tag_id"]] -= 1
+    for row in added:
+        deltas[row["tag_id"]] += 1
+
+    if removed:
+        table = NoteTag.__table__
+        db.execute(
+            delete(table).where(
+                table.c.note_id == bindparam("b_note_id"),
+                table.c.tag_id == bindparam("b_tag_id"),
+            ),
+            removed,
+        )
+    if added:
+        db.execute(insert(NoteTag), added)
+    facets.queue_tag_counts(db, user_id, deltas)
+    return names_by_note
+
+
+def retag_many(
+    db: Session,
+    user_id: int,
+    note_ids: Iterable[int],
+    *,
+    add: Iterable[str] = (),
+    remove: Iterable[str] = (),
+) -> None:
+    """Adds and removes tags on many notes, keeping their other tags."""
+    note_ids = list(note_ids)
+    add = normalize_tags(add)
+    remove = [n for n in normalize_tags(remove) if n not in add]
+    deltas = Counter()
+    table = NoteTag.__table__
+    if remove:
+        deleted = db.scalars(
+            delete(table)
+            .where(
+                table.c.note_id.in_(note_ids),
+                table.c.tag_id.in_(
+                    select(Tag.id).where(Tag.tag_name.in_(remove))
+                ),
+            )
+            .returning(table.c.tag_id)
+        )
+        deltas.subtract(deleted)
+    tag_ids = resolve_tags(db, add).values()
+    if tag_ids:
+        # RETURNING only yields the rows actually inserted, not the links
+        # that already existed
+        inserted = db.scalars(
+            _insert_ignore(db, NoteTag).returning(NoteTag.tag_id),
+            [{"note_id": n, "tag_id": t} for n in note_ids for t in tag_ids],
+        )
+        deltas.update(inserted)
+    facets.queue_tag_counts(db, user_id, deltas)
@@ -0,0 +1,106 @@
+"""
+Batch note endpoints against the per-note endpoints.
+
+Creates, updates, retags and deletes N notes once through the per-note
+endpoints (one request per note) and once through /api/notes/batch, and
+prints the wall time and the number of SQL statements of each phase.
+
+    python -m benchmarks.batch --notes 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/batch.db"
+os.environ["ASYNC_DB"] = "false"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.config.db import Base, SessionLocal, engine  # noqa: E402
+from app.helper import create_access_token  # noqa: E402
+from app.models import User  # noqa: E402
+from main import app  # noqa: E402
+
+
+class Phase:
+    """Wall time and SQL statement count of a block."""
+
+    statements = 0
+
+    def __init__(self, name: str, mode: str):
+        self.name = name
+        self.mode = mode
+
+    def __enter__(self):
+        self.start_statements = Phase.statements
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        used = Phase.statements - self.start_statements
+        print(f"{self.name:8} {self.mode:9} {elapsed:8.3f}s {used:7} statements")
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(*args):
+    Phase.statements += 1
+
+
+def seed() -> dict:
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(first_name="Bench", last_name="User",
+                    email="bench@example.com", password="x")
+        db.add(user)
+        db.commit()
+        token = create_access_token({"sub": user.email, "user_id": str(user.id)})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _note(i: int) -> dict:
+    return {"title": f"note {i}", "content": "lorem ipsum " * 20,
+            "tag_names": [f"tag-{i % 10}", f"tag-{i % 7}"]}
+
+
+def per_note(client: TestClient, headers: dict, notes: int) -> None:
+    with Phase("create", "per-note"):
+        ids = [client.post("/api/notes/", json=_note(i), headers=headers).json()["id"]
+               for i in range(notes)]
+    with Phase("update", "per-note"):
+        for i in ids:
+            client.put(f"/api/notes/{i}", headers=headers, json={
+                "title": f"edited {i}", "content": "body", "tag_names": ["edited"]})
+    with Phase("delete", "per-note"):
+        for i in ids:
+            client.delete(f"/api/notes/{i}", headers=headers)
+
+
+def batch(client: TestClient, headers: dict, notes: int) -> None:
+    with Phase("create", "batch"):
+        results = client.post("/api/notes/batch/create", headers=headers, json={
+            "items": [_note(i) for i in range(notes)]}).json()["results"]
+        ids = [r["id"] for r in results]
+    with Phase("update", "batch"):
+        client.post("/api/notes/batch/update", headers=headers, json={"items": [
+            {"id": i, "title": f"edited {i}", "content": "body", "tag_names": ["edited"]}
+            for i in ids]})
+    with Phase("retag", "batch"):
+        client.post("/api/notes/batch/tags", headers=headers, json={
+            "ids": ids, "add": ["extra"], "remove": ["edited"]})
+    with Phase("delete", "batch"):
+        client.post("/api/notes/batch/delete", headers=headers, json={"ids": ids})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notes", type=int, default=500)
+    args = parser.parse_args()
+
+    headers = seed()
+    with TestClient(app) as client:
+        client.get("/api/auth/me", headers=headers)  # warm the token cache
+        per_note(client, headers, args.notes)
+        batch(client, headers, args.notes)
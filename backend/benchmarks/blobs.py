@@ -0,0 +1,149 @@
+"""
+Storage and listing cost of large note bodies, inline or as content blobs.
+
+Seeds a throwaway SQLite database with two identical sets of users, each
+user holding copies of the same few large templates plus some unique
+large notes. One set is written with every body inline in `notes.content`
+(as before app.blobs), the other through app.blobs. Then it prints:
+
+- the bytes stored for the bodies of each set,
+- the median time to read a column stored after `content` (created_at,
+  is_public, ...) from the notes of every user of a set: SQLite walks the
+  overflow pages of a large inline body to reach it,
+- the median time to build a page of `GET /api/notes/` of each set, with
+  the body cache of app.blobs empty and warm.
+
+    python -m benchmarks.blobs --users 200 --templates 5 --unique 5
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/blobs.db"
+os.environ["ASYNC_DB"] = "false"
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import blobs  # noqa: E402
+from app.config.db import Base, SessionLocal, engine  # noqa: E402
+from app.config.settings import settings  # noqa: E402
+from app.models import ContentBlob, Note, User  # noqa: E402
+from app.routers.note import NOTE_COLUMNS, _note_rows_out  # noqa: E402
+from app.routers.note_batch import insert_notes  # noqa: E402
+from main import app  # noqa: E402,F401  (registers every model)
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod".split()
+
+
+def _body(rng: random.Random, size: int) -> str:
+    lines, length = [], 0
+    while length < size:
+        line = " ".join(rng.choices(WORDS, k=rng.randint(4, 14))) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines)
+
+
+def seed(users: int, templates: int, unique: int, size: int, seed: int):
+    """The user ids of the inline set and of the blob set."""
+    rng = random.Random(seed)
+    shared = [_body(rng, size) for _ in range(templates)]
+    Base.metadata.create_all(engine)
+    threshold = settings.CONTENT_BLOB_MIN_BYTES
+    sets = {}
+    with SessionLocal() as db:
+        for name, min_bytes in (("inline", 2 ** 62), ("blobs", threshold)):
+            settings.CONTENT_BLOB_MIN_BYTES = min_bytes
+            user_ids = []
+            for u in range(users):
+                user = User(first_name="Bench", last_name=name,
+                            email=f"{name}{u}@example.com", password="x")
+                db.add(user)
+                db.flush()
+                user_ids.append(user.id)
+                notes = [{"title": f"Template {i}", "content": body}
+                         for i, body in enumerate(shared)]
+                notes += [{"title": f"Note {i}", "content": _body(rng, size)}
+                          for i in range(unique)]
+                insert_notes(db, user.id, notes)
+            db.commit()
+            sets[name] = user_ids
+    settings.CONTENT_BLOB_MIN_BYTES = threshold
+    return sets
+
+
+def stored_bytes(db, user_ids) -> int:
+    notes = db.scalar(
+        select(func.sum(func.length(func.cast(Note.content, ContentBlob.data.type))))
+        .where(Note.user_id.in_(user_ids))
+    )
+    hashes = select(Note.content_hash).where(Note.user_id.in_(user_ids))
+    data = db.scalar(
+        select(func.sum(func.length(ContentBlob.data)))
+        .where(ContentBlob.hash.in_(hashes))
+    )
+    return notes + (data or 0)
+
+
+def scan_time(user_ids, repeat: int) -> float:
+    times = []
+    with SessionLocal() as db:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db.execute(select(func.count(), func.max(Note.created_at))
+                       .where(Note.user_id.in_(user_ids))).one()
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def page_time(user_ids, warm: bool, repeat: int) -> float:
+    times = []
+    with SessionLocal() as db:
+        for _ in range(repeat):
+            for user_id in user_ids[:20]:
+                if not warm:
+                    blobs._bodies.clear()
+                start = time.perf_counter()
+                rows = (
+                    db.query(*NOTE_COLUMNS)
+                    .filter(Note.user_id == user_id)
+                    .order_by(Note.updated_at.desc(), Note.id.desc())
+                    .limit(50)
+                    .all()
+                )
+                _note_rows_out(db, rows, user_id)
+                times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--templates", type=int, default=5,
+                        help="large notes copied into every account")
+    parser.add_argument("--unique", type=int, default=5,
+                        help="large notes of each account of its own")
+    parser.add_argument("--size", type=int, default=16384, help="bytes of a large note")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sets = seed(args.users, args.templates, args.unique, args.size, args.seed)
+    codec = "zstd" if blobs.zstandard is not None else "zlib"
+    print(f"{args.users} users x ({args.templates} templates + {args.unique} unique) "
+          f"notes of {args.size / 1024:.0f} KiB, blobs compressed with {codec}")
+    with SessionLocal() as db:
+        inline = stored_bytes(db, sets["inline"])
+        stored = stored_bytes(db, sets["blobs"])
+    print(f"stored   inline {inline / 2 ** 20:9.1f} MiB   blobs {stored / 2 ** 20:9.1f} MiB"
+          f"  ({inline / stored:.1f}x smaller)")
+    scan = {name: scan_time(ids, args.repeat) * 1000 for name, ids in sets.items()}
+    print(f"scan     inline {scan['inline']:9.1f} ms    blobs {scan['blobs']:9.1f} ms"
+          f"   (notes of all {args.users} users)")
+    for warm in (False, True):
+        page = {name: page_time(ids, warm, args.repeat) * 1000 for name, ids in sets.items()}
+        print(f"page     inline {page['inline']:9.2f} ms    blobs {page['blobs']:9.2f} ms"
+              f"   ({'warm' if warm else 'cold'} body cache)")
@@ -0,0 +1,111 @@
+"""
+Effect of the password hashing pool on unrelated requests.
+
+Fires a burst of concurrent logins while a fixed number of clients keep
+listing notes, once with bcrypt in the request threadpool and once on the
+hashing process pool, and prints the latency percentiles of the listing
+requests and of the hashing jobs.
+
+    python -m benchmarks.hashing --logins 200 --readers 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/hashing.db"
+
+import httpx  # noqa: E402
+
+from app.config.db import Base, SessionLocal, engine  # noqa: E402
+from app.hashing import _hash, hash_latency, hasher  # noqa: E402
+from app.helper import create_access_token  # noqa: E402
+from app.models import Note, User  # noqa: E402
+from main import app  # noqa: E402
+
+
+def seed() -> str:
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(first_name="Bench", last_name="User",
+                    email="bench@example.com", password=_hash("secret"))
+        db.add(user)
+        db.flush()
+        db.add_all(Note(user_id=user.id, title=f"note {i}", content="lorem")
+                   for i in range(50))
+        db.commit()
+        return create_access_token({"sub": user.email, "user_id": str(user.id)})
+
+
+def _percentiles(samples):
+    if len(samples) < 2:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    q = statistics.quantiles(samples, n=100)
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+async def scenario(token: str, logins: int, readers: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {token}"}
+    read_latencies = []
+    statuses = []
+    burst_done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login():
+            response = await client.post(
+                "/api/auth/login",
+                json={"email": "bench@example.com", "password": "secret"},
+            )
+            statuses.append(response.status_code)
+
+        async def reader():
+            while not burst_done.is_set():
+                start = time.perf_counter()
+                await client.get("/api/notes/", headers=headers)
+                read_latencies.append(time.perf_counter() - start)
+
+        await client.get("/api/notes/", headers=headers)  # warm the token cache
+        reader_tasks = [asyncio.create_task(reader()) for _ in range(readers)]
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        burst_done.set()
+        await asyncio.gather(*reader_tasks)
+
+    return {
+        "burst_seconds": elapsed,
+        "rejected": statuses.count(503),
+        "reads": len(read_latencies),
+        **_percentiles(read_latencies),
+    }
+
+
+async def main(logins: int, readers: int, workers: int):
+    token = seed()
+    hasher.max_pending = logins
+    for label, pool_size in (("threadpool", 0), (f"{workers} processes", workers)):
+        hasher.workers = pool_size
+        result = await scenario(token, logins, readers)
+        print(
+            f"{label:>14}: burst {result['burst_seconds']:.2f}s, "
+            f"{result['reads']} reads, read latency "
+            f"p50 {result['p50'] * 1000:.1f}ms p95 {result['p95'] * 1000:.1f}ms "
+            f"p99 {result['p99'] * 1000:.1f}ms, {result['rejected']} rejected"
+        )
+    hasher.shutdown()
+
+    for labels, data in hash_latency.snapshot().items():
+        print(f"hash {dict(labels)}: {data['count']} jobs, "
+              f"mean {data['sum'] / data['count'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--readers", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.readers, args.workers))
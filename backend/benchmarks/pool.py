@@ -0,0 +1,108 @@
+"""
+Connection pool throughput benchmark.
+
+Runs the same mixed read/write workload (listing a user's notes and
+inserting notes) from a fixed number of threads against engines built with
+different pool settings, and prints the throughput of each one.
+
+    python -m benchmarks.pool --threads 32 --ops 200
+    DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.pool
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeout
+from sqlalchemy.orm import sessionmaker
+
+from app.config.db import Base, build_engine
+from app.models import Note, User
+
+POOL_CONFIGS = [
+    # (pool_size, max_overflow)
+    (1, 0),
+    (5, 10),
+    (10, 20),
+    (20, 40),
+]
+
+
+def _seed(Session, users: int, notes_per_user: int):
+    with Session() as db:
+        for u in range(users):
+            user = User(first_name="Bench", last_name=str(u),
+                        email=f"bench{u}@example.com", password="x")
+            db.add(user)
+            db.flush()
+            db.add_all(
+                Note(user_id=user.id, title=f"note {n}", content="lorem " * 50)
+                for n in range(notes_per_user)
+            )
+        db.commit()
+
+
+def _worker(Session, users: int, ops: int, write_ratio: float):
+    done = errors = 0
+    for _ in range(ops):
+        user_id = random.randint(1, users)
+        try:
+            with Session() as db:
+                if random.random() < write_ratio:
+                    db.add(Note(user_id=user_id, title="bench", content="lorem"))
+                    db.commit()
+                else:
+                    db.execute(
+                        select(Note.id, Note.title, Note.updated_at)
+                        .where(Note.user_id == user_id)
+                        .order_by(Note.updated_at.desc())
+                        .limit(50)
+                    ).all()
+            done += 1
+        except (OperationalError, PoolTimeout):
+            errors += 1
+    return done, errors
+
+
+def run(url: str, threads: int, ops: int, write_ratio: float, users: int):
+    results = []
+    for pool_size, max_overflow in POOL_CONFIGS:
+        engine = build_engine(url, pool_size=pool_size,
+                              max_overflow=max_overflow, pool_timeout=5)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+        _seed(Session, users, 100)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = list(pool.map(
+                lambda _: _worker(Session, users, ops, write_ratio),
+                range(threads),
+            ))
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+        done = sum(d for d, _ in outcomes)
+        errors = sum(e for _, e in outcomes)
+        results.append((pool_size, max_overflow, done / elapsed, errors))
+
+    print(f"{'pool_size':>10} {'overflow':>9} {'ops/s':>10} {'errors':>7}")
+    for pool_size, max_overflow, throughput, errors in results:
+        print(f"{pool_size:>10} {max_overflow:>9} {throughput:>10.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=100)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    run(url, args.threads, args.ops, args.write_ratio, args.users)
@@ -0,0 +1,202 @@
+"""
+Query-count budgets for the notes endpoints.
+
+Seeds a throwaway SQLite database with heavily shared and tagged notes,
+calls every notes endpoint once and counts the SQL statements it runs.
+Exits with status 1 when an endpoint goes over its budget, so it can gate
+CI:
+
+    python -m benchmarks.query_budget
+    python -m benchmarks.query_budget --notes 500 --shares 20
+
+Budgets are absolute: they must hold whatever the page size, the number of
+shares per note or the number of tags per note.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/budget.db"
+os.environ["ASYNC_DB"] = "false"
+# Write-behind jobs are run between requests, outside of their budgets
+os.environ["OUTBOX_WORKER"] = "false"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import facets, outbox  # noqa: E402
+from app.config.db import Base, SessionLocal, engine  # noqa: E402
+from app.helper import create_access_token  # noqa: E402
+from app.models import Note, NoteTag, SharedNote, Tag, User  # noqa: E402
+from app.search import search_index  # noqa: E402
+from main import app  # noqa: E402
+
+# (name, method, path, json body, budget)
+BUDGETS = [
+    ("current user", "GET", "/api/auth/me", None, 0),
+    ("list notes", "GET", "/api/notes/?size=100", None, 5),
+    ("list notes not modified", "GET", "/api/notes/?size=100", None, 1),
+    ("list notes fields", "GET", "/api/notes/?size=100&fields=title,tags,snippet", None, 4),
+    ("get note", "GET", "/api/notes/{note_id}", None, 1),
+    ("get note cached", "GET", "/api/notes/{note_id}", None, 1),
+    ("get note not modified", "GET", "/api/notes/{note_id}", None, 1),
+    ("search text", "GET", "/api/notes/search?q=note&size=100", None, 4),
+    ("search tag", "GET", "/api/notes/search?tag=tag-1&size=100", None, 4),
+    ("search fields", "GET", "/api/notes/search?q=note&size=100&fields=title,snippet", None, 2),
+    ("stream search", "GET", "/api/notes/search/stream?q=note", None, 4),
+    ("facets", "GET", "/api/notes/facets", None, 2),
+    ("tag suggest", "GET", "/api/tags/suggest?prefix=tag", None, 2),
+    ("tag suggest cached", "GET", "/api/tags/suggest?prefix=tag-1", None, 0),
+    ("shared with me", "GET", "/api/notes/shared?size=100", None, 2),
+    ("shared fields", "GET", "/api/notes/shared?size=100&fields=title,snippet", None, 2),
+    ("stream shared", "GET", "/api/notes/shared/stream", None, 1),
+    ("public note", "GET", "/api/notes/public/{public_token}", None, 2),
+    ("public note cached", "GET", "/api/notes/public/{public_token}", None, 1),
+    ("create note", "POST", "/api/notes/",
+     {"title": "new", "content": "body", "tag_names": [f"new-{i}" for i in range(20)]}, 11),
+    ("update note", "PUT", "/api/notes/{note_id}",
+     {"title": "edited", "content": "body", "tag_names": [f"tag-{i}" for i in range(10, 30)]}, 17),
+    ("note revisions", "GET", "/api/notes/{note_id}/revisions", None, 2),
+    ("note revision", "GET", "/api/notes/{note_id}/revisions/1", None, 2),
+    ("restore revision", "POST", "/api/notes/{note_id}/revisions/1/restore", None, 11),
+    ("share note", "POST", "/api/notes/share",
+     {"note_id": "{note_id}", "shared_with_user_email": "reader-extra@example.com"}, 6),
+    ("public link", "POST", "/api/notes/public-link", {"note_id": "{note_id}"}, 5),
+    ("remove public link", "DELETE", "/api/notes/public-link/{public_note_id}", None, 4),
+    ("unshare note", "DELETE", "/api/notes/share/{share_id}", None, 6),
+    ("delete note", "DELETE", "/api/notes/{note_id}", None, 9),
+    ("batch create", "POST", "/api/notes/batch/create",
+     {"items": [{"title": f"batch {i}", "content": "body", "tag_names": [f"tag-{i}", "new"]}
+                for i in range(50)]}, 8),
+    ("batch update", "POST", "/api/notes/batch/update",
+     {"items": [{"id": "{batch_a}", "title": "edited", "tag_names": ["tag-1", "new"]},
+                {"id": "{batch_b}", "content": "edited"}]}, 14),
+    ("batch retag", "POST", "/api/notes/batch/tags",
+     {"ids": ["{batch_a}", "{batch_b}"], "add": ["tag-9", "new"], "remove": ["tag-0"]}, 8),
+    ("batch delete", "POST", "/api/notes/batch/delete",
+     {"ids": ["{batch_a}", "{batch_b}"]}, 7),
+]
+
+
+class QueryCounter:
+    def __init__(self, bind):
+        self.count = 0
+        event.listen(bind, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def seed(notes: int, shares: int, tags: int) -> dict:
+    Base.metadata.create_all(engine)
+    search_index.setup(engine)
+    with SessionLocal() as db:
+        owner = User(first_name="Owner", last_name="User",
+                     email="owner@example.com", password="x")
+        readers = [
+            User(first_name="Reader", last_name=str(i),
+                 email=f"reader-{i}@example.com", password="x")
+            for i in range(shares)
+        ]
+        extra = User(first_name="Reader", last_name="Extra",
+                     email="reader-extra@example.com", password="x")
+        db.add_all([owner, extra, *readers])
+        db.flush()
+
+        db.execute(insert(Tag), [{"tag_name": f"tag-{i}"} for i in range(tags)])
+        tag_ids = db.scalars(Tag.__table__.select().with_only_columns(Tag.id)).all()
+
+        note_rows = [
+            Note(user_id=owner.id, title=f"note {i}", content="lorem ipsum " * 20)
+            for i in range(notes)
+        ]
+        db.add_all(note_rows)
+        db.flush()
+        note_rows[0].is_public = True
+        note_rows[0].public_token = "budget-public-token"
+
+        db.execute(insert(NoteTag), [
+            {"note_id": n.id, "tag_id": t} for n in note_rows for t in tag_ids
+        ])
+        db.execute(insert(SharedNote), [
+            {"note_id": n.id, "shared_by_user_id": owner.id,
+             "shared_with_user_id": r.id}
+            for n in note_rows for r in readers
+        ])
+        db.commit()
+        search_index.rebuild(db)
+        facets.rebuild(db)
+        db.commit()
+        share_id = db.query(SharedNote.id).filter(
+            SharedNote.note_id == note_rows[2].id).first()[0]
+
+        return {
+            "owner_token": _token_for(owner),
+            "reader_token": _token_for(readers[0]),
+            "note_id": note_rows[1].id,
+            "public_note_id": note_rows[0].id,
+            "public_token": "budget-public-token",
+            "share_id": share_id,
+            "batch_a": note_rows[3].id,
+            "batch_b": note_rows[4].id,
+        }
+
+
+def _token_for(user: User) -> str:
+    return create_access_token({"sub": user.email, "user_id": str(user.id)})
+
+
+def _fill(value, context):
+    if isinstance(value, str):
+        filled = value.format(**context)
+        return int(filled) if value.startswith("{") and filled.isdigit() else filled
+    if isinstance(value, dict):
+        return {k: _fill(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, context) for v in value]
+    return value
+
+
+def run(notes: int, shares: int, tags: int) -> bool:
+    context = seed(notes, shares, tags)
+    owner_headers = {"Authorization": f"Bearer {context['owner_token']}"}
+    reader_headers = {"Authorization": f"Bearer {context['reader_token']}"}
+
+    counter = QueryCounter(engine)
+    ok = True
+    with TestClient(app) as client:
+        # Budgets are for warm requests: resolve both users once
+        for headers in (owner_headers, reader_headers):
+            client.get("/api/auth/me", headers=headers)
+
+        etags = {}
+        for name, method, path, body, budget in BUDGETS:
+            headers = reader_headers if "shared" in name else owner_headers
+            path = _fill(path, context)
+            if name.endswith("not modified"):
+                # Revalidates the previous response of the same path
+                headers = {**headers, "If-None-Match": etags[path]}
+            counter.count = 0
+            response = client.request(method, path,
+                                      json=_fill(body, context), headers=headers)
+            used = counter.count
+            outbox.run_pending()
+            if "etag" in response.headers:
+                etags[path] = response.headers["etag"]
+            answered = response.is_success or response.status_code == 304
+            status = "ok" if used <= budget and answered else "FAIL"
+            if status == "FAIL":
+                ok = False
+            print(f"{status:4} {name:23} {response.status_code} "
+                  f"{used:3} queries (budget {budget})")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notes", type=int, default=100)
+    parser.add_argument("--shares", type=int, default=10)
+    parser.add_argument("--tags", type=int, default=5)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.notes, args.shares, args.tags) else 1)
@@ -0,0 +1,145 @@
+"""
+Storage and rebuild cost of note revisions.
+
+Seeds a throwaway SQLite database with notes edited thousands of times
+(each edit inserts, changes or removes a few lines of a long note, and
+sometimes renames it), recording every edit as app.revisions does, then
+prints:
+
+- the bytes stored for the revisions against the bytes of storing every
+  version in full,
+- the time to record an edit,
+- the time to rebuild the latest, a middle and the oldest version.
+
+Then it compacts the history down to --keep revisions per note.
+
+    python -m benchmarks.revisions --notes 5 --edits 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/revisions.db"
+os.environ["ASYNC_DB"] = "false"
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import revisions  # noqa: E402
+from app.config.db import Base, SessionLocal, engine  # noqa: E402
+from app.models import Note, NoteRevision, User  # noqa: E402
+from main import app  # noqa: E402,F401  (registers every model)
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod".split()
+
+
+def _line(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(4, 14))) + "\n"
+
+
+def _edit(rng: random.Random, version: revisions.Version) -> revisions.Version:
+    title, content = version
+    lines = content.splitlines(keepends=True)
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(lines) + 1)
+        roll = rng.random()
+        if roll < 0.5 or len(lines) < 10:
+            lines.insert(i, _line(rng))
+        elif roll < 0.8 and i < len(lines):
+            lines[i] = _line(rng)
+        elif i < len(lines):
+            del lines[i]
+    if rng.random() < 0.05:
+        title = f"{title.split(' #')[0]} #{rng.randint(1, 1000)}"
+    return title, "".join(lines)
+
+
+def seed(notes: int, edits: int, lines: int, seed: int):
+    """Note ids, the versions of each note and the record times."""
+    rng = random.Random(seed)
+    Base.metadata.create_all(engine)
+    versions, record_times = {}, []
+    with SessionLocal() as db:
+        user = User(first_name="Bench", last_name="User",
+                    email="bench@example.com", password="x")
+        db.add(user)
+        db.flush()
+        for n in range(notes):
+            version = (f"Note {n}", "".join(_line(rng) for _ in range(lines)))
+            note = Note(user_id=user.id, title=version[0], content=version[1])
+            db.add(note)
+            db.flush()
+            history = [version]
+            while len(history) <= edits:
+                edited = _edit(rng, history[-1])
+                if edited == history[-1]:
+                    continue
+                start = time.perf_counter()
+                revisions.record(db, note.id, history[-1], edited)
+                record_times.append(time.perf_counter() - start)
+                history.append(edited)
+            versions[note.id] = history
+            db.commit()
+    return versions, record_times
+
+
+def rebuild_time(note_ids, number: int, repeat: int) -> float:
+    times = []
+    with SessionLocal() as db:
+        for _ in range(repeat):
+            for note_id in note_ids:
+                start = time.perf_counter()
+                revisions.get_version(db, note_id, number)
+                times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notes", type=int, default=5)
+    parser.add_argument("--edits", type=int, default=2000, help="edits per note")
+    parser.add_argument("--lines", type=int, default=200, help="lines of a new note")
+    parser.add_argument("--keep", type=int, default=100,
+                        help="revisions per note kept by the compaction")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    versions, record_times = seed(args.notes, args.edits, args.lines, args.seed)
+    note_ids = list(versions)
+    last = args.edits + 1
+
+    with SessionLocal() as db:
+        # Every version must rebuild to what was recorded
+        for note_id, history in versions.items():
+            for number in {1, last // 2, last - 1, last}:
+                rebuilt = revisions.get_version(db, note_id, number)
+                assert (rebuilt["title"], rebuilt["content"]) == history[number - 1]
+        stored = db.scalar(select(func.sum(func.length(NoteRevision.data))))
+        count = db.scalar(select(func.count()).select_from(NoteRevision))
+
+    full = sum(len(t.encode()) + len(c.encode())
+               for history in versions.values() for t, c in history)
+    print(f"{count} revisions of {args.notes} notes, snapshot every "
+          f"{revisions.settings.REVISION_SNAPSHOT_INTERVAL}")
+    print(f"stored     {stored / 1024:10.1f} KiB  ({stored / count:7.1f} B per revision)")
+    print(f"full copies {full / 1024:9.1f} KiB  ({full / stored:7.1f}x the stored size)")
+    print(f"record     {statistics.median(record_times) * 1000:10.2f} ms per edit (median)")
+    for name, number in (("latest", last), ("middle", last // 2), ("oldest", 1)):
+        ms = rebuild_time(note_ids, number, args.repeat) * 1000
+        print(f"rebuild    {ms:10.2f} ms  {name} version (#{number})")
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        deleted = revisions.compact(db, keep=args.keep, max_age_days=0)
+        db.commit()
+        elapsed = time.perf_counter() - start
+        stored = db.scalar(select(func.sum(func.length(NoteRevision.data))))
+        for note_id, history in versions.items():
+            first = max(1, last - args.keep + 1)
+            rebuilt = revisions.get_version(db, note_id, first)
+            assert (rebuilt["title"], rebuilt["content"]) == history[first - 1]
+    print(f"compact    {elapsed * 1000:10.2f} ms  deleted {deleted} revisions, "
+          f"{stored / 1024:.1f} KiB left")
@@ -0,0 +1,134 @@
+"""
+CPU cost of serializing one page of notes.
+
+Seeds a throwaway SQLite database with a user whose notes are tagged and
+shared, then renders the same page of `GET /api/notes/` in two ways and
+prints the median CPU time per page:
+
+- models: Note entities turned into NoteOut models, then what FastAPI does
+  with a response_model (dump the models, validate the dump against the
+  response type, serialize it) and a json.dumps.
+- rows: the endpoint's fast path, plain dicts built from row tuples and
+  rendered by ORJSONResponse.
+
+    python -m benchmarks.serialization --notes 1000 --size 100
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Union
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/serialization.db"
+os.environ["ASYNC_DB"] = "false"
+
+from fastapi_pagination import Page  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.config.db import Base, SessionLocal, engine  # noqa: E402
+from app.models import Note, NoteTag, SharedNote, Tag, User  # noqa: E402
+from app.responses import ORJSONResponse  # noqa: E402
+from app.routers.note import (  # noqa: E402
+    NOTE_COLUMNS,
+    _note_out,
+    _note_out_options,
+    _note_rows_out,
+)
+from app.schemaes.note import CursorPage, NoteOut  # noqa: E402
+from main import app  # noqa: E402,F401  (registers every model)
+
+response_type = TypeAdapter(Union[Page[NoteOut], CursorPage[NoteOut]])
+
+
+def seed(notes: int, tags: int, shares: int) -> int:
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        users = [User(first_name=f"User{i}", last_name="Bench",
+                      email=f"user{i}@example.com", password="x")
+                 for i in range(shares + 1)]
+        db.add_all(users)
+        db.flush()
+        owner, readers = users[0], users[1:]
+        tag_ids = [
+            db.scalar(insert(Tag).values(tag_name=f"tag-{i}").returning(Tag.id))
+            for i in range(tags)
+        ]
+        note_ids = sorted(db.scalars(insert(Note).returning(Note.id), [
+            {"user_id": owner.id, "title": f"Note {i}",
+             "content": "Lorem ipsum dolor sit amet. " * 20}
+            for i in range(notes)
+        ]))
+        if tag_ids:
+            db.execute(insert(NoteTag), [
+                {"note_id": n, "tag_id": t} for n in note_ids for t in tag_ids
+            ])
+        if readers:
+            db.execute(insert(SharedNote), [
+                {"note_id": n, "shared_by_user_id": owner.id, "shared_with_user_id": r.id}
+                for n in note_ids for r in readers
+            ])
+        db.commit()
+        return owner.id
+
+
+def models_page(user_id: int, size: int) -> bytes:
+    with SessionLocal() as db:
+        notes = (
+            db.query(Note)
+            .options(*_note_out_options())
+            .filter(Note.user_id == user_id)
+            .order_by(Note.updated_at.desc(), Note.id.desc())
+            .limit(size)
+            .all()
+        )
+        page = CursorPage(items=[_note_out(n) for n in notes], size=size)
+        value = response_type.validate_python(page.model_dump(by_alias=True))
+        content = response_type.dump_python(value, mode="json")
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def rows_page(user_id: int, size: int) -> bytes:
+    with SessionLocal() as db:
+        rows = [
+            tuple(row) for row in
+            db.query(*NOTE_COLUMNS)
+            .filter(Note.user_id == user_id)
+            .order_by(Note.updated_at.desc(), Note.id.desc())
+            .limit(size)
+        ]
+        page = CursorPage(items=_note_rows_out(db, rows, user_id), size=size)
+        return ORJSONResponse(dict(page)).body
+
+
+def measure(render, user_id: int, size: int, repeat: int) -> float:
+    render(user_id, size)
+    times = []
+    for _ in range(repeat):
+        start = time.process_time()
+        render(user_id, size)
+        times.append(time.process_time() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=100, help="notes per page")
+    parser.add_argument("--tags", type=int, default=5, help="tags per note")
+    parser.add_argument("--shares", type=int, default=3, help="shares per note")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    user_id = seed(args.notes, args.tags, args.shares)
+    # Both paths must render the same document
+    assert json.loads(models_page(user_id, args.size)) == json.loads(rows_page(user_id, args.size))
+
+    baseline = None
+    for name, render in (("models", models_page), ("rows", rows_page)):
+        cpu = measure(render, user_id, args.size, args.repeat)
+        baseline = baseline or cpu
+        print(f"{name:7} {cpu * 1000:8.2f} ms CPU per page of {args.size}"
+              f"  ({baseline / cpu:4.1f}x)")
@@ -0,0 +1,17 @@
+# Read by `gunicorn main:app` from this directory; see app/server.py
+from app.config.settings import settings
+from app.server import reset_after_fork, worker_count
+
+bind = settings.WEB_BIND
+workers = worker_count()
+worker_class = "app.server.Worker"
+preload_app = True
+
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS_JITTER
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+keepalive = settings.WEB_KEEPALIVE
+
+
+def post_fork(server, worker):
+    reset_after_fork()
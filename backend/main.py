@@ -1,15 +1,55 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
 from app.routers.auth import router as UserRouter
 from app.routers.note import router as NoteRouter
+from app.routers.note_transfer import router as NoteTransferRouter
+from app.routers.note_batch import router as NoteBatchRouter
+from app.routers.note_revisions import router as NoteRevisionRouter
+from app.routers.tags import router as TagRouter
+from app import outbox
+from app.compression import CompressionMiddleware
+from app.config.db import AnySession, SessionLocal, async_engine, engine, get_session, run_db
+from app.config.settings import settings
+from app.hashing import hasher
+from app.metrics import render_prometheus
+from app.profiling import ProfilingMiddleware, install_query_hooks
+from app.responses import ORJSONResponse
+from app.search import backfill, search_index
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_pagination import add_pagination
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    search_index.setup(engine)
+    with SessionLocal() as db:
+        backfill(db)
+        db.commit()
+    if settings.OUTBOX_WORKER:
+        outbox.worker.start()
+    yield
+    await outbox.worker.stop()
+    hasher.shutdown()
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
 app = FastAPI(
     title="Notes Management API",
-    version="1.0.0")
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan)
 
 add_pagination(app)
+install_query_hooks(engine)
+if async_engine is not None:
+    install_query_hooks(async_engine.sync_engine)
 origins = [
     "http://localhost:3000",
 ]
@@ -20,6 +60,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 router = APIRouter(
     prefix = ''
@@ -29,6 +71,42 @@ router = APIRouter(
 async def hello():
     return {"message": "Hello from router!"}
 
+
+@router.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: the worker is serving requests."""
+    return {"status": "ok"}
+
+
+@router.get("/ready", include_in_schema=False)
+async def ready(session: AnySession = Depends(get_session)):
+    """Readiness: a pooled database connection answers. 503 otherwise."""
+    def run(db: Session):
+        db.execute(text("SELECT 1"))
+
+    try:
+        await run_db(session, run)
+    except Exception as exc:
+        return JSONResponse(
+            {"status": "unavailable", "database": type(exc).__name__},
+            status_code=503,
+        )
+    return {"status": "ok", "database": "ok"}
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Metrics of this worker process in the Prometheus text format. Under
+    gunicorn every worker has its own; a scrape reaches one of them.
+    """
+    return PlainTextResponse(render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
 app.include_router(router)
 app.include_router(UserRouter,prefix='/api')
-app.include_router(NoteRouter,prefix='/api')
\ No newline at end of file
+app.include_router(NoteTransferRouter,prefix='/api')
+app.include_router(NoteRouter,prefix='/api')
+app.include_router(NoteBatchRouter,prefix='/api')
+app.include_router(NoteRevisionRouter,prefix='/api')
+app.include_router(TagRouter,prefix='/api')
\ No newline at end of file